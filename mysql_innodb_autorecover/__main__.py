@@ -1,7 +1,8 @@
 """
  Recover lost rows from innodb pages
  Usage:
-   mysql_innodb_autorecover [-l LEVEL] (-u USERNAME) [-p PASSWORD] (-H HOSTNAME) [-P PORT] (-D DATABASE) [-t TABLES] (-r RECOVERYDIR) (-d DATADIR)
+   mysql_innodb_autorecover [-l LEVEL] (-u USERNAME) [-p PASSWORD] (-H HOSTNAME) [-P PORT] (-D DATABASE) [-t TABLES] (-r RECOVERYDIR) (-d DATADIR) [options]
+   mysql_innodb_autorecover [-l LEVEL] (--schema FILE) [-t TABLES] (-r RECOVERYDIR) (-d DATADIR) [options]
    mysql_innodb_autorecover -v | --version
    mysql_innodb_autorecover -h | --help
 
@@ -13,11 +14,45 @@
    -p PASSWORD                        MySQL password - If not provided, enter when prompted
    -H HOSTNAME                        MySQL hostname
    -P PORT                            MySQL port
-   -D DATABASE                        MySQL database
-   -t TABLES                          (optional) mySQL tables to recover. If left out all the tables from the database are considered for recovering). Comma-separated list of tables, or a filename prepended with @, for ex: @/tmp/tables.txt
+   -D DATABASE                        MySQL database. Several databases recover in one run as a comma-separated list or glob patterns, for ex: shop,crm or 'shop_*'. '*' stands for every database but the system ones
+   -t TABLES                          (optional) mySQL tables to recover. If left out all the tables from the database are considered for recovering). Comma-separated list of tables, or a filename prepended with @, for ex: @/tmp/tables.txt. With several databases, <database>.<table> selects a table of one database only
    -r RECOVERYDIR                         (optional) path to a directory where percona tool is downloaded and compiled. If not specified a temporary directory is created and deleted automatically when the process stops
    -d DATADIR                         path to MySQL data directory or a copy of it (ex: /var/lib/mysql) 
+   -j JOBS --jobs JOBS                number of tables to recover in parallel, each in its own build and work directory [default: 1]
+   -c CACHEDIR --cache-dir CACHEDIR   directory where the downloaded and compiled percona tools are kept and shared across runs [default: ~/.cache/mysql_innodb_autorecover]
+   --rebuild-tools                    discard the cached percona tools and compiled binaries, then download and compile them again
+   --make-jobs N                      number of parallel make jobs used to compile the percona tools. Defaults to the number of CPUs
+   --parser-jobs N                    number of constraints_parser processes run in parallel over the indexes of a table [default: 1]
+   --page-scanner SCANNER             how index pages are extracted from .ibd files. Options: page_parser (percona tool, one file per page), native (in-process, one file per index) [default: page_parser]
+   --page-size BYTES                  (optional) InnoDB page size for the native scanner. Read from the tablespace header if left out
+   --no-page-filter                   hand every index page to constraints_parser, including pages without delete-marked or garbage records
+   --pool-size N                      (optional) number of pooled MySQL connections. Defaults to the number of parallel jobs
+   --secondary-indexes                also parse secondary index pages. By default only the clustered (primary) index is parsed, as secondary indexes only yield partial rows
+   --defs-generator GENERATOR         how table_defs.h is generated for each table. Options: native (from the schema metadata fetched once), create_defs.pl (percona perl script, one connection per table) [default: native]
+   --save-schema FILE                 (optional) save the schema metadata of the selected tables to FILE, for later offline runs with --schema
+   --schema FILE                      recover offline from a schema snapshot saved with --save-schema, without connecting to MySQL
+   --system-tablespace                recover tables without an .ibd file from the shared system tablespace, which is scanned once for all of them
+   --ibdata FILES                     comma-separated files of the system tablespace, relative to DATADIR [default: ibdata1]
+   --resume                           resume an interrupted run from the journal in RECOVERYDIR, skipping the work it already completed
+   --merge                            merge the rows recovered from every index of a table into one file, a single row per primary key
+   --diff                             look up the primary keys of recovered rows in the live table and keep only the rows it no longer has
+   --diff-batch N                     number of primary keys looked up per query with --diff [default: 1000]
+   --diff-jobs N                      number of lookup queries run in parallel per table with --diff [default: 1]
+   --apply                            load the recovered files into their tables once recovery completes, instead of only writing the SQL file
+   --dry-run                          with --apply, only validate the recovered files against the table schema, without writing to the database
+   --apply-jobs N                     number of tables loaded in parallel with --apply. Defaults to the number of parallel jobs
+   --chunk-rows N                     rows loaded per transaction with --apply, larger files are split into chunks [default: 100000]
+   --metrics-stream FILE              (optional) append the timings and counts of every stage to FILE as JSON lines, as they complete
+   --incremental                      skip tables whose tablespace, schema and options are unchanged since they were last recovered into RECOVERYDIR
+   --scratch-dir DIR                  (optional) directory for the extracted pages and parsed files of the tables being recovered, for example on tmpfs or another volume
+   --min-free-space MB                free space kept on the volume of the intermediate files, tables wait for running ones to finish when they would not fit [default: 1024]
+   --compress                         write the recovered files gzip compressed, straight from constraints_parser into their final location
+   --compress-level N                 gzip compression level with --compress, 1 (fastest) to 9 (smallest) [default: 6]
+   --compress-threads N               number of threads compressing each file with --compress, more than one needs pigz [default: 1]
+   --estimate FILE                    only sample the pages of every table and rank the tables by their estimated deleted records, writing the ranking to FILE for -t @FILE
+   --estimate-sample N                number of pages sampled per table with --estimate [default: 256]
 """
+import os
 import sys
 import logging, coloredlogs, verboselogs
 
@@ -28,9 +63,16 @@ from colorama import Fore, Back, Style
 
 from mysql_innodb_autorecover import APPVSN, APPNAME
 from mysql_innodb_autorecover.mysql.mysql import MySQLUtil
+from mysql_innodb_autorecover.mysql.metadata import Metadata
 from mysql_innodb_autorecover.service.yum import Yum
 from mysql_innodb_autorecover.percona.app import Percona
+from mysql_innodb_autorecover.percona.compress import Compressor
 from mysql_innodb_autorecover.service.recover import Recover
+from mysql_innodb_autorecover.service.journal import Journal
+from mysql_innodb_autorecover.service.loader import Loader
+from mysql_innodb_autorecover.service.metrics import Metrics
+from mysql_innodb_autorecover.service.estimate import Estimator
+from mysql_innodb_autorecover.service.instance import Instance
 
 init()
 
@@ -48,16 +90,64 @@ def main(args=None):
     yumutil = Yum()
     yumutil.setup_requirements()
 
-    mysql = MySQLUtil(
-                host=arguments['-H'],
-                port=arguments['-P'],
-                user=arguments['-u'],
-                password=arguments['-p'],
-                database=arguments['-D'],
-                tables=arguments['-t']
-            )
+    apply_jobs = arguments['--apply-jobs'] or arguments['--jobs']
+    if arguments['--schema']:
+        if arguments['--diff']:
+            logger.critical("--diff looks rows up in the live tables and cannot be used with --schema")
+            sys.exit(-1)
+        if arguments['--apply'] and not arguments['--dry-run']:
+            logger.critical("--apply loads rows into the live tables and cannot be used with --schema, use --dry-run to only validate them")
+            sys.exit(-1)
+        mysql = None
+        metadatas = Metadata.from_snapshot(arguments['--schema'], MySQLUtil.parse_tables(arguments['-t']))
+    else:
+        mysql = MySQLUtil(
+                    host=arguments['-H'],
+                    port=arguments['-P'],
+                    user=arguments['-u'],
+                    password=arguments['-p'],
+                    database=arguments['-D'],
+                    tables=arguments['-t'],
+                    pool_size=arguments['--pool-size'] or max(int(arguments['--jobs']) * (int(arguments['--diff-jobs']) if arguments['--diff'] else 1), int(apply_jobs))
+                )
+        metadatas = mysql.metadatas
+        if arguments['--save-schema']:
+            Metadata.save_all(metadatas, arguments['--save-schema'])
+
+    if arguments['--estimate']:
+        # Nothing is compiled nor extracted, the data directory is only read
+        estimator = Estimator(arguments['-d'], metadatas, sample=arguments['--estimate-sample'], secondary_indexes=arguments['--secondary-indexes'],
+                              ibdata=arguments['--ibdata'] if arguments['--system-tablespace'] else None, page_size=arguments['--page-size'])
+        estimator.estimate(arguments['--estimate'])
+        return
 
-    percona = Percona(recovery=arguments['-r'], datadir=arguments['-d'])
-    recover = Recover(mysql, percona)
-    recover.recover()
+    metrics = Metrics(stream=arguments['--metrics-stream'])
+    percona = Percona(
+                recovery=arguments['-r'],
+                datadir=arguments['-d'],
+                cache_dir=os.path.expanduser(arguments['--cache-dir']),
+                rebuild_tools=arguments['--rebuild-tools'],
+                make_jobs=arguments['--make-jobs'],
+                parser_jobs=arguments['--parser-jobs'],
+                page_scanner=arguments['--page-scanner'],
+                page_size=arguments['--page-size'],
+                page_filter=not arguments['--no-page-filter'],
+                defs_generator=arguments['--defs-generator'],
+                ibdata=arguments['--ibdata'] if arguments['--system-tablespace'] else None,
+                metrics=metrics,
+                scratch_dir=arguments['--scratch-dir'],
+                compressor=Compressor(arguments['--compress-level'], arguments['--compress-threads']) if arguments['--compress'] else None
+            )
+    loader = None
+    if arguments['--apply']:
+        loader = Loader(mysql, metadatas, jobs=apply_jobs, chunk_rows=arguments['--chunk-rows'], dry_run=arguments['--dry-run'], metrics=metrics)
+    recovers = []
+    for metadata in metadatas:
+        # Every database gets its own directory under recovered/ when there are several
+        database_percona = percona.for_database(metadata.database) if len(metadatas) > 1 else percona
+        journal = Journal(database_percona.recovered_dir, resume=arguments['--resume'])
+        recovers.append(Recover(mysql, database_percona, jobs=arguments['--jobs'], secondary_indexes=arguments['--secondary-indexes'], metadata=metadata, journal=journal,
+                                incremental=arguments['--incremental'], merge=arguments['--merge'], diff=arguments['--diff'], diff_batch=arguments['--diff-batch'],
+                                diff_jobs=arguments['--diff-jobs']))
+    Instance(percona, recovers, jobs=arguments['--jobs'], loader=loader, min_free_space=int(arguments['--min-free-space']) << 20).recover()
 
@@ -0,0 +1,161 @@
+"""
+ Benchmark the recovery pipeline end to end on a synthetic tablespace, without a MySQL server
+ Run as: python -m mysql_innodb_autorecover.benchmark.pipeline
+
+ Usage:
+   pipeline [-s SIZE] [-i INDEXES] [-x DELETED] [--redundant] [--page-size BYTES] [-n RUNS] [-w WORKDIR] [-c CACHEDIR] [--page-scanner SCANNER] [--scan-only] [-o RESULTS] [-b BASELINE] [-t TOLERANCE]
+   pipeline -h | --help
+
+ Options:
+   -h --help                          show this help message and exit
+   -s SIZE                            size of the generated tablespace in MB [default: 64]
+   -i INDEXES                         number of indexes in the tablespace, the clustered one included [default: 1]
+   -x DELETED                         share of delete-marked records, 0 to 1 [default: 0.05]
+   --redundant                        generate REDUNDANT rows (row format 4) instead of COMPACT (5)
+   --page-size BYTES                  InnoDB page size of the generated tablespace [default: 16384]
+   -n RUNS                            number of runs, the best time of every stage is reported [default: 3]
+   -w WORKDIR                         (optional) directory for the tablespace and recovered data. A temporary directory is used if not specified
+   -c CACHEDIR                        directory where the percona tools are kept and shared with mysql_innodb_autorecover [default: ~/.cache/mysql_innodb_autorecover]
+   --page-scanner SCANNER             how index pages are extracted. Options: page_parser, native [default: native]
+   --scan-only                        only time the native page scan, without the percona tools
+   -o RESULTS                         (optional) save the results to RESULTS as JSON, for comparing later versions against
+   -b BASELINE                        (optional) results saved by an earlier run, fail when a stage got slower than it
+   -t TOLERANCE                       slowdown of a stage against the baseline tolerated before failing, in percent [default: 10]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import platform
+import logging, coloredlogs, verboselogs
+
+from os.path import join, getsize
+from docopt import docopt, DocoptExit
+from mysql_innodb_autorecover import APPVSN
+from mysql_innodb_autorecover.innodb import page
+from mysql_innodb_autorecover.innodb.scanner import PageScanner
+from mysql_innodb_autorecover.benchmark.tablespace import TablespaceGenerator
+from mysql_innodb_autorecover.service.metrics import Metrics
+
+verboselogs.install()
+logger = logging.getLogger(__name__)
+
+DATABASE = "benchmark"
+TABLE    = "synthetic"
+
+
+def generate(workdir, parameters) -> str:
+    ibd_file = join(workdir, "data", DATABASE, "%s.ibd" % TABLE)
+    os.makedirs(os.path.dirname(ibd_file), exist_ok=True)
+    pages = parameters["size"] * (1 << 20) // parameters["page_size"]
+    started = time.monotonic()
+    generator = TablespaceGenerator(ibd_file, pages, parameters["row_format"], parameters["indexes"], parameters["deleted"], parameters["page_size"]).generate()
+    logger.info("Generated %d pages, %d records (%d delete-marked) in %.2fs: %s", generator.pages, generator.records, generator.deleted_records,
+                time.monotonic() - started, ibd_file)
+    return ibd_file
+
+def run_scan(ibd_file, output_dir, row_format) -> dict:
+    compact = row_format != 4
+    metrics = Metrics()
+    with metrics.stage(TABLE, "pages") as stage:
+        scanner = PageScanner(ibd_file)
+        scanner.scan(output_dir, None, lambda view, offset, page_size: page.has_deleted_records(view, offset, page_size, compact))
+        stage["bytes_read"] = scanner.size
+        stage["pages"] = scanner.pages
+        stage["bytes_written"] = sum(scanner.index_pages.values()) * scanner.page_size
+    return metrics.totals()
+
+def run_pipeline(workdir, run, parameters, cache_dir) -> dict:
+    # Imported here so that --scan-only works without the build requirements of the percona tools
+    from mysql_innodb_autorecover.percona.app import Percona
+    from mysql_innodb_autorecover.service.recover import Recover
+    metrics = Metrics()
+    percona = Percona(datadir=join(workdir, "data"), recovery=join(workdir, "run-%d" % run), cache_dir=cache_dir, page_scanner=parameters["page_scanner"],
+                      metrics=metrics)
+    metadata = TablespaceGenerator.metadata(DATABASE, TABLE, parameters["row_format"], parameters["indexes"])
+    Recover(None, percona, metadata=metadata).recover()
+    return metrics.totals()
+
+def best_of(runs, workdir, run_stages) -> dict:
+    best = {}
+    for run in range(runs):
+        output_dir = join(workdir, "run-%d" % run)
+        os.makedirs(output_dir, exist_ok=True)
+        try:
+            stages = run_stages(run, output_dir)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        for name, totals in stages.items():
+            if name not in best or totals["wall"] < best[name]["wall"]:
+                best[name] = totals
+    for totals in best.values():
+        totals["mb_per_s"] = totals["bytes_read"] / totals["wall"] / (1 << 20) if totals["wall"] else 0.0
+        totals["records_per_s"] = totals["records"] / totals["wall"] if totals["wall"] else 0.0
+    return best
+
+def report(stages):
+    for name, totals in stages.items():
+        logger.info("%-10s %8.3fs wall %8.3fs CPU %8.3fs child CPU %9.1f MB/s %10.0f records/s", name, totals["wall"], totals["cpu"], totals["child_cpu"],
+                    totals["mb_per_s"], totals["records_per_s"])
+
+def compare(results, baseline, tolerance) -> bool:
+    if baseline["parameters"] != results["parameters"]:
+        logger.warning("Baseline was run with different parameters: %s", baseline["parameters"])
+    regressed = False
+    for name, totals in results["stages"].items():
+        previous = baseline["stages"].get(name)
+        if previous is None or not previous["wall"]:
+            continue
+        change = (totals["wall"] - previous["wall"]) / previous["wall"] * 100
+        if change > tolerance:
+            logger.error("%-10s %8.3fs, %.1f%% slower than %.3fs in %s", name, totals["wall"], change, previous["wall"], baseline["version"])
+            regressed = True
+        else:
+            logger.info("%-10s %8.3fs, %+.1f%% against %.3fs in %s", name, totals["wall"], change, previous["wall"], baseline["version"])
+    return not regressed
+
+def main(args=None):
+    try:
+        arguments = docopt(__doc__, argv=args)
+    except DocoptExit as usage:
+        print(usage)
+        sys.exit(1)
+
+    coloredlogs.install(fmt='%(asctime)s - %(levelname)s: %(message)s', datefmt='%d/%m/%Y %I:%M:%S %p')
+    parameters = {
+        "size": int(arguments['-s']),
+        "indexes": int(arguments['-i']),
+        "deleted": float(arguments['-x']),
+        "row_format": 4 if arguments['--redundant'] else 5,
+        "page_size": int(arguments['--page-size']),
+        "page_scanner": "native" if arguments['--scan-only'] else arguments['--page-scanner'],
+        "scan_only": arguments['--scan-only']
+    }
+    runs = int(arguments['-n'])
+    workdir = arguments['-w'] if arguments['-w'] else tempfile.mkdtemp(prefix="pipeline-benchmark-")
+    ibd_file = generate(workdir, parameters)
+
+    if arguments['--scan-only']:
+        stages = best_of(runs, workdir, lambda run, output_dir: run_scan(ibd_file, output_dir, parameters["row_format"]))
+    else:
+        cache_dir = os.path.expanduser(arguments['-c'])
+        stages = best_of(runs, workdir, lambda run, output_dir: run_pipeline(workdir, run, parameters, cache_dir))
+    logger.info("Best of %d runs on %d MB (%s):", runs, getsize(ibd_file) >> 20, ", ".join("%s=%s" % item for item in parameters.items()))
+    report(stages)
+
+    results = { "version": APPVSN, "time": time.time(), "python": platform.python_version(), "machine": platform.machine(), "parameters": parameters, "stages": stages }
+    if arguments['-o']:
+        with open(arguments['-o'], 'w') as results_file:
+            json.dump(results, results_file, indent=2)
+        logger.info("Results saved to %s", arguments['-o'])
+    if not arguments['-w']:
+        shutil.rmtree(workdir)
+    if arguments['-b']:
+        with open(arguments['-b']) as baseline_file:
+            if not compare(results, json.load(baseline_file), float(arguments['-t'])):
+                sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+ Benchmark the native page scanner against percona page_parser on the same tablespace
+ Run as: python -m mysql_innodb_autorecover.benchmark.scanner
+
+ Usage:
+   scanner (-f IBDFILE) [-b PAGEPARSER] [-n RUNS] [-w WORKDIR] [--redundant]
+   scanner -h | --help
+
+ Options:
+   -h --help                          show this help message and exit
+   -f IBDFILE                         tablespace to scan
+   -b PAGEPARSER                      (optional) path to a compiled page_parser binary. If left out only the native scanner is timed
+   -n RUNS                            number of runs of each scanner, the best one is reported [default: 3]
+   -w WORKDIR                         (optional) directory for the extracted pages. A temporary directory is used if not specified
+   --redundant                        tablespace uses the REDUNDANT row format (page_parser -4 instead of -5)
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import logging, coloredlogs, verboselogs
+
+from os.path import join, getsize
+from docopt import docopt, DocoptExit
+from mysql_innodb_autorecover.innodb import page
+from mysql_innodb_autorecover.innodb.scanner import PageScanner
+
+verboselogs.install()
+logger = logging.getLogger(__name__)
+
+
+def run_native(ibd_file, output_dir) -> dict:
+    scanner = PageScanner(ibd_file)
+    started = time.monotonic()
+    scanner.scan(output_dir)
+    elapsed = time.monotonic() - started
+    return { "elapsed": elapsed, "indexes": { page.index_name(_id): count for _id, count in scanner.index_pages.items() } }
+
+def run_page_parser(binary, ibd_file, output_dir, row_format) -> dict:
+    started = time.monotonic()
+    subprocess.run([binary, "-%d" % row_format, "-f", ibd_file], cwd=output_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    elapsed = time.monotonic() - started
+    indexes = {}
+    for pages_dir in os.listdir(output_dir):
+        index_root = join(output_dir, pages_dir, page.page_type_name(page.FIL_PAGE_INDEX))
+        if os.path.isdir(index_root):
+            for index in os.listdir(index_root):
+                indexes[index] = len(os.listdir(join(index_root, index)))
+    return { "elapsed": elapsed, "indexes": indexes }
+
+def best_of(runs, workdir, scan) -> dict:
+    best = None
+    for run in range(runs):
+        output_dir = join(workdir, "run-%d" % run)
+        os.makedirs(output_dir)
+        result = scan(output_dir)
+        shutil.rmtree(output_dir)
+        if best is None or result["elapsed"] < best["elapsed"]:
+            best = result
+    return best
+
+def report(name, result, size):
+    logger.info("%-12s %8.3fs %8.1f MB/s  %d indexes, %d pages", name, result["elapsed"], size / result["elapsed"] / (1 << 20) if result["elapsed"] else 0.0,
+                len(result["indexes"]), sum(result["indexes"].values()))
+
+def main(args=None):
+    try:
+        arguments = docopt(__doc__, argv=args)
+    except DocoptExit as usage:
+        print(usage)
+        sys.exit(1)
+
+    coloredlogs.install(fmt='%(asctime)s - %(levelname)s: %(message)s', datefmt='%d/%m/%Y %I:%M:%S %p')
+    ibd_file = arguments['-f']
+    runs = int(arguments['-n'])
+    row_format = 4 if arguments['--redundant'] else 5
+    workdir = arguments['-w'] if arguments['-w'] else tempfile.mkdtemp(prefix="scanner-benchmark-")
+    size = getsize(ibd_file)
+
+    native = best_of(runs, workdir, lambda output_dir: run_native(ibd_file, output_dir))
+    report("native", native, size)
+    if arguments['-b']:
+        percona = best_of(runs, workdir, lambda output_dir: run_page_parser(os.path.abspath(arguments['-b']), ibd_file, output_dir, row_format))
+        report("page_parser", percona, size)
+        if native["indexes"] != percona["indexes"]:
+            # Both have to hand constraints_parser the same pages, only packed differently
+            logger.error("Scanners disagree on index pages: native %s, page_parser %s", native["indexes"], percona["indexes"])
+            sys.exit(1)
+        logger.info("Both scanners extracted the same pages for every index, native is %.1fx page_parser", percona["elapsed"] / native["elapsed"] if native["elapsed"] else 0.0)
+    if not arguments['-w']:
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    main()
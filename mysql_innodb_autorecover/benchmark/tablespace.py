@@ -0,0 +1,181 @@
+import struct
+import random
+
+from mysql_innodb_autorecover.innodb import page
+from mysql_innodb_autorecover.mysql.metadata import Metadata
+
+FIL_PAGE_TYPE_FSP_HDR   = 8
+FIL_PAGE_IBUF_BITMAP    = 5
+FIL_PAGE_INODE          = 3
+BUF_NO_CHECKSUM_MAGIC   = 0xDEADBEEF
+FIRST_INDEX_ID          = 1000
+CHAR_LENGTH             = 16
+
+# Compact records: 5 header bytes, origins of infimum/supremum and where user records start
+COMPACT_SUPREMUM_END    = page.PAGE_NEW_SUPREMUM + 8
+# Redundant records: 6 header bytes and one end offset per field in front of them
+REDUNDANT_SUPREMUM_END  = page.PAGE_OLD_SUPREMUM + 9
+
+
+class TablespaceGenerator:
+    """Writes a synthetic file-per-table tablespace of (id INT PRIMARY KEY, c CHAR(16)) with delete-marked records mixed in"""
+
+    def __init__(self, path, pages, row_format=5, indexes=1, deleted=0.05, page_size=page.UNIV_PAGE_SIZE, seed=0) -> None:
+        super().__init__()
+        self.path = path
+        self.pages = max(4, int(pages))
+        self.compact = int(row_format) != 4
+        self.indexes = max(1, int(indexes))
+        self.deleted = float(deleted)
+        self.page_size = int(page_size)
+        self.random = random.Random(seed)
+        self.records = 0
+        self.deleted_records = 0
+        self.next_id = 1
+
+    @staticmethod
+    def metadata(database, table, row_format=5, indexes=1) -> Metadata:
+        # Schema of the generated table, as it would be fetched from a server holding it
+        metadata = Metadata(database, [table])
+        metadata.row_formats[table] = "COMPACT" if int(row_format) != 4 else "REDUNDANT"
+        metadata.columns[table] = [
+            { "COLUMN_NAME": "id", "ORDINAL_POSITION": 1, "DATA_TYPE": "int", "COLUMN_TYPE": "int(11)", "IS_NULLABLE": "NO", "CHARACTER_MAXIMUM_LENGTH": None,
+              "CHARACTER_OCTET_LENGTH": None, "NUMERIC_PRECISION": 10, "NUMERIC_SCALE": 0, "CHARACTER_SET_NAME": None },
+            { "COLUMN_NAME": "c", "ORDINAL_POSITION": 2, "DATA_TYPE": "char", "COLUMN_TYPE": "char(%d)" % CHAR_LENGTH, "IS_NULLABLE": "NO", "CHARACTER_MAXIMUM_LENGTH": CHAR_LENGTH,
+              "CHARACTER_OCTET_LENGTH": CHAR_LENGTH, "NUMERIC_PRECISION": None, "NUMERIC_SCALE": None, "CHARACTER_SET_NAME": "latin1" }
+        ]
+        metadata.primary_keys[table] = ["id"]
+        # TYPE 3 is a clustered unique index, secondary indexes are all on c
+        metadata.indexes[table] = [{ "INDEX_ID": FIRST_INDEX_ID, "NAME": "PRIMARY", "TYPE": 3 }]
+        metadata.indexes[table] += [{ "INDEX_ID": FIRST_INDEX_ID + number, "NAME": "c_%d" % number, "TYPE": 0 } for number in range(1, int(indexes))]
+        return metadata
+
+    def generate(self):
+        # Pages after the three header pages go to the indexes in turn, each index a chain of leaf pages
+        chains = {}
+        for page_no in range(3, self.pages):
+            chains.setdefault(FIRST_INDEX_ID + (page_no - 3) % self.indexes, []).append(page_no)
+        links = {}
+        for chain in chains.values():
+            for position, page_no in enumerate(chain):
+                links[page_no] = (chain[position - 1] if position else 0xFFFFFFFF, chain[position + 1] if position + 1 < len(chain) else 0xFFFFFFFF)
+        with open(self.path, 'wb') as ibd:
+            ibd.write(self.fsp_page())
+            ibd.write(self.empty_page(1, FIL_PAGE_IBUF_BITMAP))
+            ibd.write(self.empty_page(2, FIL_PAGE_INODE))
+            for page_no in range(3, self.pages):
+                index_id = FIRST_INDEX_ID + (page_no - 3) % self.indexes
+                ibd.write(self.index_page(page_no, index_id, *links[page_no]))
+        return self
+
+    def fil_header(self, buffer, page_no, page_type, prev=0xFFFFFFFF, _next=0xFFFFFFFF):
+        lsn = 1000000 + page_no
+        page.FIL_HEADER.pack_into(buffer, 0, BUF_NO_CHECKSUM_MAGIC, page_no, prev, _next, lsn, page_type, 0, 1)
+        struct.pack_into(">II", buffer, self.page_size - page.FIL_PAGE_END_LSN, BUF_NO_CHECKSUM_MAGIC, lsn & 0xFFFFFFFF)
+
+    def empty_page(self, page_no, page_type) -> bytearray:
+        buffer = bytearray(self.page_size)
+        self.fil_header(buffer, page_no, page_type)
+        return buffer
+
+    def fsp_page(self) -> bytearray:
+        buffer = self.empty_page(0, FIL_PAGE_TYPE_FSP_HDR)
+        # Page size only goes into the flags when it is not the 16K default
+        ssize = (self.page_size // 512).bit_length() - 1 if self.page_size != page.UNIV_PAGE_SIZE else 0
+        struct.pack_into(">IIII", buffer, page.FIL_PAGE_DATA, 1, 0, self.pages, self.pages)
+        struct.pack_into(">I", buffer, page.FSP_SPACE_FLAGS, ssize << page.FSP_FLAGS_PAGE_SSIZE)
+        return buffer
+
+    def fields(self, index_id, deleted) -> list:
+        _id = self.next_id
+        self.next_id = self.next_id + 1
+        # Signed integers are stored big endian with the sign bit flipped
+        id_bytes = struct.pack(">I", (_id ^ 0x80000000) & 0xFFFFFFFF)
+        c_bytes = ("row-%d" % _id).ljust(CHAR_LENGTH)[:CHAR_LENGTH].encode('latin1')
+        if index_id != FIRST_INDEX_ID:
+            return [c_bytes, id_bytes]
+        trx_id = struct.pack(">Q", 0x1000 + _id)[2:]
+        roll_ptr = struct.pack(">Q", (0x80 if not deleted else 0) << 48 | _id)[1:]
+        return [id_bytes, trx_id, roll_ptr, c_bytes]
+
+    def index_page(self, page_no, index_id, prev, _next) -> bytearray:
+        buffer = bytearray(self.page_size)
+        self.fil_header(buffer, page_no, page.FIL_PAGE_INDEX, prev, _next)
+        infimum = page.PAGE_NEW_INFIMUM if self.compact else page.PAGE_OLD_INFIMUM
+        supremum = page.PAGE_NEW_SUPREMUM if self.compact else page.PAGE_OLD_SUPREMUM
+        heap_top = COMPACT_SUPREMUM_END if self.compact else REDUNDANT_SUPREMUM_END
+        end = self.page_size - page.FIL_PAGE_END_LSN
+        origins = []
+        while True:
+            deleted = self.random.random() < self.deleted
+            fields = self.fields(index_id, deleted)
+            extra = page.REC_N_NEW_EXTRA_BYTES if self.compact else page.REC_N_OLD_EXTRA_BYTES + len(fields)
+            length = extra + sum(len(field) for field in fields)
+            # Room is kept for a directory slot per 8 records plus those of infimum and supremum
+            if heap_top + length + 2 * ((len(origins) + 1) // 8 + 2) > end:
+                self.next_id = self.next_id - 1
+                break
+            origin = heap_top + extra
+            self.write_record(buffer, origin, fields, len(origins) + 2, deleted)
+            origins.append(origin)
+            heap_top = heap_top + length
+            self.records = self.records + 1
+            self.deleted_records = self.deleted_records + (1 if deleted else 0)
+        self.write_infimum_supremum(buffer, infimum, supremum)
+        # Link infimum -> records -> supremum
+        chain = [infimum] + origins + [supremum]
+        for current, following in zip(chain, chain[1:]):
+            self.link(buffer, current, following)
+        # Every 8th record owns a directory slot, supremum owns whatever is left
+        slots = [(infimum, 1)]
+        owned = 0
+        while len(origins) - owned > 7:
+            slots.append((origins[owned + 7], 8))
+            owned = owned + 8
+        slots.append((supremum, len(origins) - owned + 1))
+        for number, (origin, n_owned) in enumerate(slots):
+            buffer[origin - (page.REC_N_NEW_EXTRA_BYTES if self.compact else page.REC_N_OLD_EXTRA_BYTES)] |= n_owned
+            struct.pack_into(">H", buffer, end - 2 * (number + 1), origin)
+        n_heap = len(origins) + 2
+        struct.pack_into(">HHHHHHHHH", buffer, page.PAGE_HEADER, len(slots), heap_top, n_heap | (0x8000 if self.compact else 0), 0, 0,
+                         origins[-1] if origins else 0, 2, len(origins), len(origins))
+        struct.pack_into(">Q", buffer, page.PAGE_HEADER + page.PAGE_INDEX_ID, index_id)
+        return buffer
+
+    def write_record(self, buffer, origin, fields, heap_no, deleted):
+        info = page.REC_INFO_DELETED_FLAG if deleted else 0
+        data = b"".join(fields)
+        buffer[origin:origin + len(data)] = data
+        if self.compact:
+            buffer[origin - 5] = info
+            struct.pack_into(">H", buffer, origin - 4, heap_no << 3)
+        else:
+            buffer[origin - 6] = info
+            # Heap number, field count and the 1-byte offsets flag share three bytes
+            header = heap_no << 11 | len(fields) << 1 | 1
+            buffer[origin - 5:origin - 2] = header.to_bytes(3, 'big')
+            offset = 0
+            for position, field in enumerate(fields):
+                offset = offset + len(field)
+                buffer[origin - 7 - position] = offset
+
+    def write_infimum_supremum(self, buffer, infimum, supremum):
+        if self.compact:
+            struct.pack_into(">H", buffer, infimum - 4, 0 << 3 | 2)
+            buffer[infimum:infimum + 8] = b"infimum\0"
+            struct.pack_into(">H", buffer, supremum - 4, 1 << 3 | 3)
+            buffer[supremum:supremum + 8] = b"supremum"
+        else:
+            buffer[infimum - 5:infimum - 2] = (0 << 11 | 1 << 1 | 1).to_bytes(3, 'big')
+            buffer[infimum - 7] = 8
+            buffer[infimum:infimum + 8] = b"infimum\0"
+            buffer[supremum - 5:supremum - 2] = (1 << 11 | 1 << 1 | 1).to_bytes(3, 'big')
+            buffer[supremum - 7] = 9
+            buffer[supremum:supremum + 9] = b"supremum\0"
+
+    def link(self, buffer, current, following):
+        if self.compact:
+            # Compact records point to the next one relative to themselves
+            struct.pack_into(">H", buffer, current - 2, (following - current) & 0xFFFF)
+        else:
+            struct.pack_into(">H", buffer, current - 2, following)
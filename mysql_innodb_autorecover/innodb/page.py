@@ -0,0 +1,128 @@
+import struct
+
+from collections import namedtuple
+
+# FIL header, present on every page of a tablespace
+FIL_HEADER             = struct.Struct(">IIIIQHQI")
+FIL_PAGE_OFFSET        = 4
+FIL_PAGE_LSN           = 16
+FIL_PAGE_TYPE          = 24
+FIL_PAGE_DATA          = 38
+FIL_PAGE_END_LSN       = 8
+
+# Page types, named the same way page_parser names its output directories
+FIL_PAGE_INDEX         = 17855
+PAGE_TYPES             = {
+    0:     "FIL_PAGE_TYPE_ALLOCATED",
+    2:     "FIL_PAGE_UNDO_LOG",
+    3:     "FIL_PAGE_INODE",
+    4:     "FIL_PAGE_IBUF_FREE_LIST",
+    5:     "FIL_PAGE_IBUF_BITMAP",
+    6:     "FIL_PAGE_TYPE_SYS",
+    7:     "FIL_PAGE_TYPE_TRX_SYS",
+    8:     "FIL_PAGE_TYPE_FSP_HDR",
+    9:     "FIL_PAGE_TYPE_XDES",
+    10:    "FIL_PAGE_TYPE_BLOB",
+    11:    "FIL_PAGE_TYPE_ZBLOB",
+    12:    "FIL_PAGE_TYPE_ZBLOB2",
+    17855: "FIL_PAGE_INDEX",
+}
+
+# Index page header, follows the FIL header
+PAGE_HEADER            = FIL_PAGE_DATA
+PAGE_HEAP_TOP          = 2
+PAGE_N_HEAP            = 4
+PAGE_FREE              = 6
+PAGE_GARBAGE           = 8
+PAGE_N_RECS            = 16
+PAGE_LEVEL             = 26
+PAGE_INDEX_ID          = 28
+PAGE_DATA              = PAGE_HEADER + 36 + 2 * 10
+
+# Tablespace header on page 0
+FSP_SPACE_FLAGS        = FIL_PAGE_DATA + 16
+FSP_FLAGS_PAGE_SSIZE   = 6
+
+UNIV_PAGE_SIZE         = 16384
+
+FilHeader = namedtuple("FilHeader", ["checksum", "page_no", "prev", "next", "lsn", "page_type", "flush_lsn", "space_id"])
+
+
+def fil_header(buffer, offset=0) -> FilHeader:
+    return FilHeader._make(FIL_HEADER.unpack_from(buffer, offset))
+
+def page_type(buffer, offset=0) -> int:
+    return struct.unpack_from(">H", buffer, offset + FIL_PAGE_TYPE)[0]
+
+def page_type_name(_type) -> str:
+    return PAGE_TYPES.get(_type, "FIL_PAGE_TYPE_%d" % _type)
+
+def index_id(buffer, offset=0) -> int:
+    return struct.unpack_from(">Q", buffer, offset + PAGE_HEADER + PAGE_INDEX_ID)[0]
+
+def index_name(_index_id) -> str:
+    # Same <high>-<low> naming page_parser uses for index directories
+    return "%d-%d" % (_index_id >> 32, _index_id & 0xFFFFFFFF)
+
+def page_size(buffer) -> int:
+    # Page size is recorded in the FSP flags of page 0 (MySQL 5.6+), zero means the 16K default
+    flags = struct.unpack_from(">I", buffer, FSP_SPACE_FLAGS)[0]
+    ssize = (flags >> FSP_FLAGS_PAGE_SSIZE) & 0xF
+    return (512 << ssize) if ssize else UNIV_PAGE_SIZE
+
+# Record headers, stored right before each record origin
+REC_INFO_DELETED_FLAG  = 0x20
+REC_N_NEW_EXTRA_BYTES  = 5
+REC_N_OLD_EXTRA_BYTES  = 6
+PAGE_NEW_INFIMUM       = PAGE_DATA + REC_N_NEW_EXTRA_BYTES
+PAGE_NEW_SUPREMUM      = PAGE_DATA + 2 * REC_N_NEW_EXTRA_BYTES + 8
+PAGE_OLD_INFIMUM       = PAGE_DATA + 1 + REC_N_OLD_EXTRA_BYTES
+PAGE_OLD_SUPREMUM      = PAGE_DATA + 2 + 2 * REC_N_OLD_EXTRA_BYTES + 8
+
+
+def records(buffer, offset=0, page_size=UNIV_PAGE_SIZE, compact=True):
+    # Origins of the user records in list order, None last when the list is broken
+    n_recs, = struct.unpack_from(">H", buffer, offset + PAGE_HEADER + PAGE_N_RECS)
+    info_offset = REC_N_NEW_EXTRA_BYTES if compact else REC_N_OLD_EXTRA_BYTES
+    supremum = PAGE_NEW_SUPREMUM if compact else PAGE_OLD_SUPREMUM
+    rec = PAGE_NEW_INFIMUM if compact else PAGE_OLD_INFIMUM
+    # Walk the record list, bounded in case a corrupted page links back on itself
+    for _ in range(n_recs + 1):
+        if compact:
+            # Compact records point to the next one relative to themselves
+            rec = (rec + struct.unpack_from(">h", buffer, offset + rec - 2)[0]) & (page_size - 1)
+        else:
+            rec = struct.unpack_from(">H", buffer, offset + rec - 2)[0]
+        if rec == supremum:
+            return
+        if rec < info_offset or rec >= page_size:
+            break
+        yield rec
+    yield None
+
+def has_deleted_records(buffer, offset=0, page_size=UNIV_PAGE_SIZE, compact=True) -> bool:
+    free, = struct.unpack_from(">H", buffer, offset + PAGE_HEADER + PAGE_FREE)
+    if free:
+        # Purged records sit on the garbage list
+        return True
+    info_offset = REC_N_NEW_EXTRA_BYTES if compact else REC_N_OLD_EXTRA_BYTES
+    for rec in records(buffer, offset, page_size, compact):
+        # A broken list lets constraints_parser have a look at the whole page
+        if rec is None or buffer[offset + rec - info_offset] & REC_INFO_DELETED_FLAG:
+            return True
+    return False
+
+def deleted_records(buffer, offset=0, page_size=UNIV_PAGE_SIZE, compact=True) -> tuple:
+    # (delete-marked records, their bytes, purged records, their bytes) of a leaf page
+    heap_top, n_heap, _, garbage = struct.unpack_from(">HHHH", buffer, offset + PAGE_HEADER + PAGE_HEAP_TOP)
+    n_recs, = struct.unpack_from(">H", buffer, offset + PAGE_HEADER + PAGE_N_RECS)
+    info_offset = REC_N_NEW_EXTRA_BYTES if compact else REC_N_OLD_EXTRA_BYTES
+    marked = 0
+    for rec in records(buffer, offset, page_size, compact):
+        if rec is not None and buffer[offset + rec - info_offset] & REC_INFO_DELETED_FLAG:
+            marked = marked + 1
+    # Records on the heap but off the record list are the purged ones, the garbage list
+    purged = max(0, (n_heap & 0x7FFF) - 2 - n_recs)
+    # Record lengths are not stored, delete-marked ones are taken to be as long as the average record
+    user_bytes = max(0, heap_top - (PAGE_NEW_SUPREMUM + 8 if compact else PAGE_OLD_SUPREMUM + 9) - garbage)
+    return marked, user_bytes * marked // n_recs if n_recs else 0, purged, garbage
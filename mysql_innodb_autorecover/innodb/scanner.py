@@ -0,0 +1,88 @@
+import os
+import mmap
+import time
+import logging, verboselogs
+
+from os.path import join, getsize
+from colorama import Fore, Style
+from mysql_innodb_autorecover.innodb import page
+
+verboselogs.install()
+
+class PageScanner:
+    """Splits a tablespace into one contiguous page file per index, an in-process alternative to page_parser"""
+    logger = logging.getLogger(__module__)
+
+    def __init__(self, ibd_file, page_size=None) -> None:
+        super().__init__()
+        # The system tablespace may be spread over several files (ibdata1, ibdata2, ...), scanned as one
+        self.files = [ibd_file] if isinstance(ibd_file, str) else list(ibd_file)
+        self.ibd_file = self.files[0]
+        self.page_size = int(page_size) if page_size else None
+        self.pages = 0
+        self.skipped = 0
+        self.index_pages = {}
+        self.elapsed = 0.0
+
+    @property
+    def size(self):
+        return sum(getsize(ibd_file) for ibd_file in self.files)
+
+    @property
+    def throughput(self):
+        return self.size / self.elapsed / (1 << 20) if self.elapsed else 0.0
+
+    def scan(self, output_dir, indexes=None, page_filter=None) -> dict:
+        index_dir = join(output_dir, page.page_type_name(page.FIL_PAGE_INDEX))
+        if indexes is None:
+            return self.route({}, (index_dir, page_filter))
+        return self.route({ index_id: (index_dir, page_filter) for index_id in indexes })
+
+    def route(self, routes, default=None) -> dict:
+        # routes maps an index id to the (FIL_PAGE_INDEX directory, page filter) its pages go to,
+        # pages of other indexes go to default, or nowhere when there is no default
+        started = time.monotonic()
+        outputs = {}
+        try:
+            for ibd_file in self.files:
+                if getsize(ibd_file) == 0:
+                    PageScanner.logger.warn("%s is empty, nothing to scan", ibd_file)
+                    continue
+                with open(ibd_file, 'rb') as ibd, mmap.mmap(ibd.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    view = memoryview(mapped)
+                    try:
+                        self.scan_file(view, routes, default, outputs)
+                    finally:
+                        view.release()
+        finally:
+            for output in outputs.values():
+                output.close()
+        self.elapsed = time.monotonic() - started
+        PageScanner.logger.info("Scanned %d pages (%d indexes, %d pages skipped) of %s%s%s in %.2fs: %.1f MB/s", self.pages, len(self.index_pages), self.skipped,
+                                Fore.YELLOW, ", ".join(self.files), Style.RESET_ALL, self.elapsed, self.throughput)
+        return self.index_pages
+
+    def scan_file(self, view, routes, default, outputs):
+        if self.page_size is None:
+            # Only the first file of a tablespace starts with the FSP header
+            self.page_size = page.page_size(view)
+        page_size = self.page_size
+        for offset in range(0, len(view) - page_size + 1, page_size):
+            self.pages = self.pages + 1
+            if page.page_type(view, offset) != page.FIL_PAGE_INDEX:
+                continue
+            _index_id = page.index_id(view, offset)
+            target = routes.get(_index_id, default)
+            if target is None:
+                continue
+            index_dir, page_filter = target
+            if page_filter is not None and not page_filter(view, offset, page_size):
+                self.skipped = self.skipped + 1
+                continue
+            if _index_id not in outputs:
+                os.makedirs(index_dir, exist_ok=True)
+                outputs[_index_id] = open(join(index_dir, page.index_name(_index_id)), 'wb')
+                self.index_pages[_index_id] = 0
+            # Slicing the memoryview hands the mapped page to write() without copying it
+            outputs[_index_id].write(view[offset:offset + page_size])
+            self.index_pages[_index_id] = self.index_pages[_index_id] + 1
@@ -0,0 +1,13 @@
+import os
+
+from os.path import join
+
+def ibd_candidates(data_dir, database, table) -> list:
+    # Where the .ibd file of a table may be, in the order they are looked at: under its database directory, then at the top of the data directory
+    return [join(data_dir, database, table + '.ibd'), join(data_dir, table + '.ibd')]
+
+def ibd_file(data_dir, database, table):
+    for candidate in ibd_candidates(data_dir, database, table):
+        if os.path.exists(candidate):
+            return candidate
+    return None
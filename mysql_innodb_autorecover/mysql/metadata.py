@@ -0,0 +1,142 @@
+import sys
+import json
+import logging, verboselogs
+
+from colorama import Fore, Style
+from mysql.connector import Error
+
+verboselogs.install()
+
+class Metadata:
+    """Schema metadata of the tables being recovered, fetched in a few bulk queries once per run"""
+    logger  = logging.getLogger(__module__)
+    BATCH   = 500
+    COLUMNS = ["TABLE_NAME", "COLUMN_NAME", "ORDINAL_POSITION", "DATA_TYPE", "COLUMN_TYPE", "IS_NULLABLE", "CHARACTER_MAXIMUM_LENGTH",
+               "CHARACTER_OCTET_LENGTH", "NUMERIC_PRECISION", "NUMERIC_SCALE", "CHARACTER_SET_NAME"]
+
+    def __init__(self, database=None, tables=None) -> None:
+        super().__init__()
+        self.database = database
+        self.tables = list(tables) if tables else []
+        self.row_formats = {}
+        self.columns = {}
+        self.primary_keys = {}
+        self.indexes = {}
+
+    def load(self, mysql):
+        for start in range(0, len(self.tables), Metadata.BATCH):
+            batch = self.tables[start:start + Metadata.BATCH]
+            try:
+                self.load_tables(mysql, batch)
+                self.load_columns(mysql, batch)
+            except Error as e:
+                Metadata.logger.critical("Failed fetching table metadata: %s" % e)
+                sys.exit(-1)
+            self.load_indexes(mysql, batch)
+        Metadata.logger.success("Fetched metadata of %s%d%s tables", Fore.CYAN, len(self.row_formats), Style.RESET_ALL)
+        return self
+
+    def load_tables(self, mysql, tables):
+        query = "SELECT TABLE_NAME, ROW_FORMAT FROM information_schema.TABLES WHERE TABLE_SCHEMA=%%s AND TABLE_NAME IN (%s);" % Metadata.placeholders(tables)
+        for table, row_format in mysql.fetch_all(query, [self.database] + tables):
+            self.row_formats[table] = row_format
+
+    def load_columns(self, mysql, tables):
+        query = "SELECT %s FROM information_schema.COLUMNS WHERE TABLE_SCHEMA=%%s AND TABLE_NAME IN (%s) ORDER BY TABLE_NAME, ORDINAL_POSITION;" % (", ".join(Metadata.COLUMNS), Metadata.placeholders(tables))
+        for row in mysql.fetch_all(query, [self.database] + tables):
+            column = dict(zip(Metadata.COLUMNS, row))
+            self.columns.setdefault(column.pop("TABLE_NAME"), []).append(column)
+        query = "SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.STATISTICS WHERE TABLE_SCHEMA=%%s AND INDEX_NAME='PRIMARY' AND TABLE_NAME IN (%s) ORDER BY TABLE_NAME, SEQ_IN_INDEX;" % Metadata.placeholders(tables)
+        for table, column in mysql.fetch_all(query, [self.database] + tables):
+            self.primary_keys.setdefault(table, []).append(column)
+
+    def load_indexes(self, mysql, tables):
+        innodb_tables, innodb_indexes = mysql.innodb_catalog()
+        query = "SELECT t.NAME, i.INDEX_ID, i.NAME, i.TYPE FROM information_schema.%s i JOIN information_schema.%s t ON i.TABLE_ID = t.TABLE_ID WHERE t.NAME IN (%s) ORDER BY i.INDEX_ID;" % (innodb_indexes, innodb_tables, Metadata.placeholders(tables))
+        try:
+            rows = mysql.fetch_all(query, ["%s/%s" % (self.database, table) for table in tables])
+        except Error as e:
+            # Needs the PROCESS privilege, recovery still works without it by parsing every index
+            Metadata.logger.warn("InnoDB index metadata not available: %s" % e)
+            return
+        for name, index_id, index_name, _type in rows:
+            self.indexes.setdefault(name.split("/", 1)[1], []).append({ "INDEX_ID": int(index_id), "NAME": index_name, "TYPE": int(_type) })
+
+    def save(self, path):
+        Metadata.save_all([self], path)
+
+    def snapshot(self) -> dict:
+        return { "database": self.database, "tables": { table: self.definition(table) for table in self.tables if table in self.row_formats } }
+
+    @staticmethod
+    def save_all(metadatas, path):
+        # A single database is saved the way it always was, several go in a list of such snapshots
+        snapshots = [metadata.snapshot() for metadata in metadatas]
+        with open(path, 'w') as schema:
+            json.dump(snapshots[0] if len(snapshots) == 1 else { "databases": snapshots }, schema, indent=2, default=str)
+        Metadata.logger.success("Saved schema snapshot of %d tables to %s%s%s", sum(len(snapshot["tables"]) for snapshot in snapshots), Fore.YELLOW, path, Style.RESET_ALL)
+
+    def definition(self, table) -> dict:
+        return {
+            "row_format": self.row_formats[table],
+            "columns": self.columns.get(table, []),
+            "primary_key": self.primary_keys.get(table, []),
+            "indexes": self.indexes.get(table, [])
+        }
+
+    @staticmethod
+    def from_snapshot(path, tables=None) -> list:
+        with open(path) as schema:
+            snapshot = json.load(schema)
+        snapshots = snapshot.get("databases", [snapshot])
+        databases = [database_snapshot["database"] for database_snapshot in snapshots]
+        metadatas = []
+        for database_snapshot in snapshots:
+            selected = Metadata.select(tables, database_snapshot["database"], databases)
+            if selected == []:
+                continue
+            metadata = Metadata(database_snapshot["database"], selected if selected else list(database_snapshot["tables"]))
+            for table, definition in database_snapshot["tables"].items():
+                metadata.row_formats[table] = definition["row_format"]
+                metadata.columns[table] = definition["columns"]
+                if definition["primary_key"]:
+                    metadata.primary_keys[table] = definition["primary_key"]
+                if definition["indexes"]:
+                    metadata.indexes[table] = definition["indexes"]
+            metadatas.append(metadata)
+        Metadata.logger.success("Loaded schema snapshot of %s%d%s tables in %d databases from %s", Fore.CYAN, sum(len(database_snapshot["tables"]) for database_snapshot in snapshots),
+                                Style.RESET_ALL, len(snapshots), path)
+        return metadatas
+
+    @staticmethod
+    def select(tables, database, databases):
+        # Tables of -t that belong to database: <database>.<table> for that database only, plain names for every database.
+        # None when -t was left out and every table is wanted
+        if tables is None:
+            return None
+        selected = []
+        for table in tables:
+            qualifier, _, name = table.partition(".")
+            if name and qualifier in databases:
+                if qualifier == database:
+                    selected.append(name)
+            else:
+                selected.append(table)
+        return selected
+
+    @staticmethod
+    def placeholders(values) -> str:
+        return ", ".join(["%s"] * len(values))
+
+    def row_format(self, table):
+        return self.row_formats.get(table)
+
+    def clustered_index_id(self, table):
+        # TYPE is a bit field, bit 0 (DICT_CLUSTERED) marks the clustered index
+        for index in self.indexes.get(table, []):
+            if index["TYPE"] & 1:
+                return index["INDEX_ID"]
+        return None
+
+    def index_ids(self, table) -> list:
+        return [index["INDEX_ID"] for index in self.indexes.get(table, [])]
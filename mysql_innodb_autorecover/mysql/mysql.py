@@ -1,21 +1,36 @@
 import logging, verboselogs
 import os
 import sys
+import time
+import fnmatch
 
 from colorama import Fore, Style, Back
 from getpass import getpass
 from mysql.connector import cursor, pooling, Error
+from mysql.connector.errors import PoolError
+from mysql_innodb_autorecover.mysql.metadata import Metadata
 
 verboselogs.install()
 
 class MySQLUtil:
-    logger = logging.getLogger(__module__)
+    logger           = logging.getLogger(__module__)
+    SYSTEM_DATABASES = ["mysql", "information_schema", "performance_schema", "sys"]
+    WILDCARDS        = "*?["
+    # Seconds between attempts to check out a connection while every pooled one is in use
+    POOL_WAIT        = 0.05
 
-    def __init__(self, host=None, port=None, user=None, password=None, database=None, tables=None, **kwargs) -> None:
+    def __init__(self, host=None, port=None, user=None, password=None, database=None, tables=None, pool_size=1, **kwargs) -> None:
         super().__init__()
         self._host = host
         self._user = user
-        self._database = database
+        # -D is one database, a comma-separated list of them or of glob patterns, '*' for every database but the system ones
+        self._patterns = [pattern.strip() for pattern in database.split(",") if pattern.strip()] if database else []
+        self._database = self._patterns[0] if len(self._patterns) == 1 and not MySQLUtil.is_pattern(self._patterns[0]) else None
+        self._pool_size = int(pool_size)
+        if self._pool_size > pooling.CNX_POOL_MAXSIZE:
+            MySQLUtil.logger.warn("Connection pool size %d exceeds the maximum, using %d: parallel lookups and loads beyond it wait for a free connection" % (self._pool_size,
+                                  pooling.CNX_POOL_MAXSIZE))
+            self._pool_size = pooling.CNX_POOL_MAXSIZE
 
         if port is None:
             self._port = 3306
@@ -28,7 +43,8 @@ class MySQLUtil:
             self._pass = password
         
         self.check_access()
-        self.setup_tables(tables)
+        self.setup_databases()
+        self.setup_metadata(tables)
 
     @property
     def user(self):
@@ -48,31 +64,77 @@ class MySQLUtil:
 
     @property
     def database(self):
+        # None when recovering several databases, connections then have no default database
         return self._database
 
+    @property
+    def databases(self):
+        return self._databases
+
     @property
     def tables(self):
-        return self._tables
+        return [table for metadata in self._metadatas for table in metadata.tables]
+
+    @property
+    def metadata(self):
+        return self._metadatas[0]
+
+    @property
+    def metadatas(self):
+        return self._metadatas
 
     @property
     def connection(self):
-        return self.connection_pool.get_connection()
+        # The pool raises as soon as every connection is in use, callers wait for one to be returned instead
+        while True:
+            try:
+                return self.connection_pool.get_connection()
+            except PoolError:
+                time.sleep(MySQLUtil.POOL_WAIT)
 
     def fetch(self, query) -> str:
+        conn = cursor = None
         try:
-            conn = self.connection_pool.get_connection()
+            conn = self.connection
             if conn.is_connected():
-                cursor = conn.cursor()
+                # Buffered, so the rest of the result never blocks closing the cursor
+                cursor = conn.cursor(buffered=True)
                 cursor.execute(query)
                 return cursor.fetchone()
         except Error as e:
             MySQLUtil.logger.critical(e)
             return None
         finally:
-            cursor.close()
+            if cursor is not None:
+                cursor.close()
+            if conn is not None:
+                conn.close()
+
+    def fetch_all(self, query, params=None) -> list:
+        conn = self.connection
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(query, params)
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+        finally:
             conn.close()
 
-    def row_format(self, _format) -> int:
+    def innodb_catalog(self):
+        # InnoDB dictionary tables were renamed in MySQL 8.0
+        if not hasattr(self, '_innodb_catalog'):
+            query = "SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA='information_schema' AND TABLE_NAME='INNODB_INDEXES';"
+            row = self.fetch(query)
+            if row is not None and row[0]:
+                self._innodb_catalog = ("INNODB_TABLES", "INNODB_INDEXES")
+            else:
+                self._innodb_catalog = ("INNODB_SYS_TABLES", "INNODB_SYS_INDEXES")
+        return self._innodb_catalog
+
+    @staticmethod
+    def row_format(_format) -> int:
         if _format.upper() == "REDUNDANT":
             return 4
         else:
@@ -82,39 +144,73 @@ class MySQLUtil:
         try:
             self.connection_pool = pooling.MySQLConnectionPool(
                     pool_name="recover",
-                    pool_size=1,
+                    pool_size=self._pool_size,
                     pool_reset_session=True,
+                    # Needed by --apply, which loads the recovered files with LOAD DATA LOCAL INFILE
+                    allow_local_infile=True,
                     host=self._host,
                     user=self._user,
                     password=self._pass,
                     port=int(self._port),
                     database=self._database
             )
-            MySQLUtil.logger.success("Successfully connected to database '%s' with '%s@%s'" % (self._database, self._user, self._host))
+            MySQLUtil.logger.success("Successfully connected to database '%s' with '%s@%s'" % (", ".join(self._patterns), self._user, self._host))
         except Error as e:
             MySQLUtil.logger.critical(e)
             sys.exit(-1)
 
 
-    def setup_tables(self, tables):
+    def setup_databases(self):
+        if not any(MySQLUtil.is_pattern(pattern) for pattern in self._patterns):
+            self._databases = list(self._patterns)
+            return
+        try:
+            available = [ row[0] for row in self.fetch_all("SHOW DATABASES;") ]
+        except Error as e:
+            MySQLUtil.logger.critical(e)
+            sys.exit(-1)
+        # System databases are only recovered when named
+        self._databases = [ database for database in available if database in self._patterns or
+                            (database not in MySQLUtil.SYSTEM_DATABASES and any(fnmatch.fnmatchcase(database, pattern) for pattern in self._patterns)) ]
+        if not self._databases:
+            MySQLUtil.logger.critical("No database matches %s" % ", ".join(self._patterns))
+            sys.exit(-1)
+        MySQLUtil.logger.success("Recovering %s%d%s databases: %s" % (Fore.CYAN, len(self._databases), Style.RESET_ALL, ", ".join(self._databases)))
+
+    def setup_metadata(self, tables):
+        tables = MySQLUtil.parse_tables(tables)
+        self._metadatas = []
+        for database in self._databases:
+            selected = Metadata.select(tables, database, self._databases)
+            if selected is None:
+                selected = self.fetch_tables(database)
+            if not selected:
+                MySQLUtil.logger.warn("No tables to recover in database %s" % database)
+                continue
+            self._metadatas.append(Metadata(database, selected).load(self))
+        if not self._metadatas:
+            MySQLUtil.logger.critical("No tables to recover")
+            sys.exit(-1)
+
+    @staticmethod
+    def parse_tables(tables):
         if tables is None or tables == "":
-            self.fetch_tables()
+            return None
         elif tables.startswith("@"):
             with open(tables[1:]) as tables_list:
-                self._tables = [ table.strip() for table in filter(None, tables_list.read().splitlines()) ]
+                # Anything after a # is a comment, like the counts written by --estimate
+                return [ table for table in (line.split("#", 1)[0].strip() for line in tables_list.read().splitlines()) if table ]
         else:
-            self._tables = [table.strip() for table in tables.split(",")]
+            return [table.strip() for table in tables.split(",")]
 
-    def fetch_tables(self):
+    def fetch_tables(self, database) -> list:
         try:
-            conn = self.connection_pool.get_connection()
-            if conn.is_connected():
-                cursor = conn.cursor()
-                cursor.execute("show tables;")
-                self._tables = [ row[0] for row in cursor.fetchall() ]
-                cursor.close()
-                conn.close()
+            return [ row[0] for row in self.fetch_all("SHOW TABLES FROM `%s`;" % database.replace("`", "``")) ]
         except Error as e:
             MySQLUtil.logger.critical(e)
             sys.exit(-1)
 
+    @staticmethod
+    def is_pattern(database) -> bool:
+        return any(wildcard in database for wildcard in MySQLUtil.WILDCARDS)
+
@@ -10,9 +10,23 @@ import glob
 import pathlib
 import shutil
 import re
+import hashlib
+import threading
+import queue
+import collections
+import copy
+import shlex
 
 from os.path import join, basename, split
+from concurrent.futures import ThreadPoolExecutor
 from mysql_innodb_autorecover import PERCONA_URL
+from mysql_innodb_autorecover.percona.cache import BinaryCache, FileLock
+from mysql_innodb_autorecover.percona.defs import TableDefs
+from mysql_innodb_autorecover.percona.load_data import LoadData
+from mysql_innodb_autorecover.percona.compress import Compressor, LineCounter
+from mysql_innodb_autorecover.innodb import page, tablespace
+from mysql_innodb_autorecover.innodb.scanner import PageScanner
+from mysql_innodb_autorecover.service.metrics import Metrics
 from colorama import Fore, Back, Style
 from tqdm import tqdm
 from alive_progress import alive_bar
@@ -24,51 +38,147 @@ class Percona:
     PAGE_PARSER_BIN        = "page_parser"
     CREATE_DEFS_BIN        = "create_defs.pl"
     CONSTRAINTS_PARSER_BIN = "constraints_parser"
-    RECOVERED_TABLES       = set()
-    TABLES                 = 0
-    INDEXES                = 0
-    RECOVERED_INDEXES      = 0
-    LOAD_SQL_QUERIES       = []
+    MYSQL_SOURCE_DIR       = "mysql-source"
+    NATIVE_SCANNER         = "native"
+    NATIVE_GENERATOR       = "native"
+    TOOLS_COMPLETE         = ".complete"
+    PARSE_STARTED          = ".parsing"
+    # (line prefix or None, text, replacement) applied to every line of the Makefile. Part of the tool cache key
+    MAKEFILE_PATCHES       = [
+        ("CFLAGS=", "-Wall -O3", "-Wall -O3 -fgnu89-inline"),
+        (None, "gcc $(INCLUDES)", "gcc $(CFLAGS) $(INCLUDES)"),
+        (None, "gcc  -o", "gcc $(CFLAGS) $(INCLUDES) -o"),
+        (None, "constraints_parser innochecksum", "constraints_parser innochecksum ibdconnect"),
+        # Recursive makes have to go through $(MAKE) to share the parallel jobserver
+        (None, "&& make ", "&& $(MAKE) "),
+    ]
+    # A compiler or linker invocation echoed by make, one per build target
+    BUILD_TARGET           = re.compile(r"^\s*(\S*/)?(gcc|cc|g\+\+|c\+\+)\s|--mode=(compile|link)\s|^\s*(CC|CXX|CCLD|CXXLD)\s")
+    BUILD_ERROR_TAIL       = 50
 
-    def __init__(self, datadir=None, recovery=None) -> None:
+    def __init__(self, datadir=None, recovery=None, cache_dir=None, rebuild_tools=False, make_jobs=None, parser_jobs=1, page_scanner=PAGE_PARSER_BIN, page_size=None, page_filter=True, defs_generator=NATIVE_GENERATOR, ibdata=None, metrics=None, scratch_dir=None, compressor=None) -> None:
         super().__init__()
-        self.workdir = os.getcwd()
+        # Counters and stage timings of this run
+        self.metrics = metrics if metrics else Metrics()
         self.data_dir = datadir
+        # Set on the views of for_database when recovering several databases
+        self.database = None
+        # Files of the shared system tablespace, relative to the data directory
+        self.ibdata_files = [join(datadir, ibdata_file.strip()) for ibdata_file in ibdata.split(",")] if ibdata else []
+        self.system_tablespace_tables = set()
+        self.defs_generator = defs_generator
+        self.page_filter = page_filter
+        # Recovered files are written compressed when set
+        self.compressor = compressor
+        self.page_scanner = page_scanner
+        self.page_size = int(page_size) if page_size else None
+        if page_scanner not in (Percona.PAGE_PARSER_BIN, Percona.NATIVE_SCANNER):
+            Percona.logger.critical("Unknown page scanner '%s', expected %s or %s", page_scanner, Percona.PAGE_PARSER_BIN, Percona.NATIVE_SCANNER)
+            sys.exit(-1)
+        if defs_generator not in (Percona.CREATE_DEFS_BIN, Percona.NATIVE_GENERATOR):
+            Percona.logger.critical("Unknown table definitions generator '%s', expected %s or %s", defs_generator, Percona.CREATE_DEFS_BIN, Percona.NATIVE_GENERATOR)
+            sys.exit(-1)
+        self.make_jobs = int(make_jobs) if make_jobs else (os.cpu_count() or 1)
+        self.parser_jobs = max(1, int(parser_jobs))
 
-        # Create temporary directories for downloads and compiling
+        # Create temporary directory for per table compiling
         self.tmpdir = tempfile.TemporaryDirectory().name
-        self.download_dir = join(self.tmpdir, "download")
-        self.tool_dir = join(self.tmpdir, "tools")
-        self.tool_defs_dir = join(self.tool_dir, "defs")
+        self.workspaces_dir = join(self.tmpdir, "tables")
+
+        # Downloaded, patched and compiled tools are kept across runs and shared between processes
+        self.cache_dir = cache_dir if cache_dir else join(recovery, "cache")
+        self.download_dir = join(self.cache_dir, "download")
+        self.tools_dir = join(self.cache_dir, "tools")
+        self.binaries_dir = join(self.cache_dir, Percona.CONSTRAINTS_PARSER_BIN)
 
-      
         # Create directory for recovered data
         os.makedirs(recovery, exist_ok=True)
         self.recovered_dir = join(recovery, "recovered")
-        self.recovered_indexes_dir = join(self.recovered_dir, "indexes")
+        # Extracted pages and parsed files are only kept until a table is recovered, possibly on another volume
+        self.recovered_indexes_dir = join(scratch_dir if scratch_dir else self.recovered_dir, "indexes")
+        os.makedirs(self.recovered_indexes_dir, exist_ok=True)
 
         Percona.logger.info("Temporary working directory located at: %s%s%s", Fore.YELLOW, self.tmpdir, Style.RESET_ALL)
-        self.download()
-        self.extract()
-        self.patch_makefile()
-        self.compile()
+        Percona.logger.info("Tool cache directory located at: %s%s%s", Fore.YELLOW, self.cache_dir, Style.RESET_ALL)
+        self.setup_tools(rebuild_tools)
+
+        # Compiled constraints_parser binaries are kept across runs, one per table structure
+        self.binary_cache = BinaryCache(self.binaries_dir)
+
+    def for_database(self, database):
+        # Same tools, binary cache and metrics, with the files of the database's tables kept apart from other databases
+        percona = copy.copy(self)
+        percona.database = database
+        percona.recovered_dir = join(self.recovered_dir, database)
+        percona.recovered_indexes_dir = join(self.recovered_indexes_dir, database)
+        percona.workspaces_dir = join(self.workspaces_dir, database)
+        percona.system_tablespace_tables = set()
+        return percona
+
+    def qualified(self, table) -> str:
+        # Name of the table in logs, metrics and the run report
+        return "%s.%s" % (self.database, table) if self.database else table
+
+    def quoted(self, table) -> str:
+        if self.database:
+            return "`%s`.`%s`" % (self.database.replace("`", "``"), table.replace("`", "``"))
+        return "`%s`" % table.replace("`", "``")
+
+    def setup_tools(self, rebuild=False):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with FileLock(join(self.cache_dir, "tools.lock")):
+            if rebuild:
+                Percona.logger.notice("Rebuilding Percona tools, invalidating cache at %s%s%s", Fore.YELLOW, self.cache_dir, Style.RESET_ALL)
+                for cached in (self.download_dir, self.tools_dir, self.binaries_dir):
+                    shutil.rmtree(cached, ignore_errors=True)
+            self.download()
+            self.tool_dir = join(self.tools_dir, self.tool_key())
+            complete = join(self.tool_dir, Percona.TOOLS_COMPLETE)
+            if os.path.exists(complete):
+                with open(complete) as marker:
+                    self.source_dir = join(self.tool_dir, marker.read().strip())
+                Percona.logger.notice("Using cached Percona tools: %s%s%s", Fore.YELLOW, self.source_dir, Style.RESET_ALL)
+                return
+            # Left over from an interrupted build
+            shutil.rmtree(self.tool_dir, ignore_errors=True)
+            with self.metrics.stage(None, "tools") as stage:
+                self.extract()
+                self.patch_makefile()
+                self.compile()
+                stage["bytes_read"] = os.path.getsize(self.archive)
+            with open(complete, 'w') as marker:
+                marker.write(basename(self.source_dir))
+
+    def tool_key(self) -> str:
+        archive_digest = hashlib.sha256()
+        with open(self.archive, 'rb') as archive:
+            for chunk in iter(lambda: archive.read(1 << 20), b""):
+                archive_digest.update(chunk)
+        digest = hashlib.sha256()
+        for item in (PERCONA_URL, archive_digest.hexdigest(), repr(Percona.MAKEFILE_PATCHES)):
+            digest.update(item.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()[:16]
 
     def download(self):
         os.makedirs(self.download_dir, exist_ok=True)
-        self.archive = join(self.download_dir, "recovery-tool.tar.gz")
+        self.archive = join(self.download_dir, basename(PERCONA_URL))
         if os.path.exists(self.archive):
             return
 
         Percona.logger.notice("Downloading Percona recovery tool from: %s%s%s", Style.DIM, PERCONA_URL, Style.RESET_ALL)
+        partial = self.archive + ".part"
         try:
-            data = requests.get(PERCONA_URL)
-            with open(self.archive, 'wb') as file:
-                for data in tqdm(data.iter_content()):
+            data = requests.get(PERCONA_URL, stream=True)
+            data.raise_for_status()
+            with open(partial, 'wb') as file:
+                for data in tqdm(data.iter_content(chunk_size=65536)):
                     file.write(data)
+            os.replace(partial, self.archive)
         except Exception as e:
             Percona.logger.critical("Failed downloading recovery tool: %s" % e)
             try:
-                os.remove(self.archive)
+                os.remove(partial)
             except:
                 pass
             sys.exit(-1)
@@ -91,160 +201,424 @@ class Percona:
         makefile = join(self.source_dir, "Makefile")
         Percona.logger.info("Patching Makefile: %s%s%s", Fore.YELLOW, makefile, Style.RESET_ALL)
         for line in fileinput.input(makefile, inplace=1):
-            if line.startswith("CFLAGS="):
-                line = line.replace("-Wall -O3", "-Wall -O3 -fgnu89-inline")
-            if "gcc $(INCLUDES)" in line:
-                line = line.replace("gcc $(INCLUDES)", "gcc $(CFLAGS) $(INCLUDES)")
-            if "gcc  -o" in line:
-                line = line.replace("gcc  -o", "gcc $(CFLAGS) $(INCLUDES) -o")
-            if "constraints_parser innochecksum" in line:
-                line = line.replace("constraints_parser innochecksum", "constraints_parser innochecksum ibdconnect")
+            for prefix, text, replacement in Percona.MAKEFILE_PATCHES:
+                if (prefix is None or line.startswith(prefix)) and text in line:
+                    line = line.replace(text, replacement)
             sys.stdout.write(line)
 
 
-    def compile(self, alternate=False):
-        src_dir = self.tool_defs_dir if alternate else self.source_dir
-        counter = 71 if alternate else 1171
+    def compile(self, workspace=None, progress=True):
+        src_dir = workspace if workspace else self.source_dir
+        command = ["make", "-j%d" % self.make_jobs]
+        targets = self.count_build_targets(src_dir)
 
-        Percona.logger.info("Compiling Percona tools %s%s%s", Fore.YELLOW, src_dir, Style.RESET_ALL)
-        os.chdir(src_dir)
-        make = subprocess.Popen("make", stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-        stderr = []
-        with alive_bar(counter, title='Running make...', enrich_print=True, spinner="dots_reverse") as bar:
-            bar.text("[%s%sRunning configure%s]"%(Style.BRIGHT, Fore.MAGENTA, Style.RESET_ALL))
-            for line in iter(make.stdout.readline, ""):
-                bar()
-                if line.startswith("cd mysql-source/include && make my_config.h"):
-                  bar.text("[%s%sCompiling%s]"%(Style.BRIGHT, Fore.CYAN, Style.RESET_ALL))
-            for line in iter(make.stderr.readline, ""):
-                bar()
+        Percona.logger.info("Compiling Percona tools %s%s%s with %d make jobs", Fore.YELLOW, src_dir, Style.RESET_ALL, self.make_jobs)
+        make = subprocess.Popen(command, cwd=src_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        # Drain both pipes at once, make blocks as soon as either of them fills up
+        lines = queue.Queue()
+        for stream in (make.stdout, make.stderr):
+            threading.Thread(target=Percona.read_stream, args=(stream, lines), daemon=True).start()
+        stderr = collections.deque(maxlen=Percona.BUILD_ERROR_TAIL)
+        if not progress:
+            # Several tables may be compiling at once, a progress bar per build would garble the terminal
+            self.follow_build(make, lines, stderr)
+        else:
+            with alive_bar(targets, title='Running make...', enrich_print=True, spinner="dots_reverse") as bar:
+                bar.text("[%s%sRunning configure%s]"%(Style.BRIGHT, Fore.MAGENTA, Style.RESET_ALL))
+                self.follow_build(make, lines, stderr, bar)
         return_code = make.wait()
         if return_code:
             for line in stderr:
-                Percona.logger.error(line.strip())
+                Percona.logger.error(line.rstrip())
             Percona.logger.critical("Compile failed! Please check Makefile generated errors above and fix them before running this program again. Return code: %d", return_code)
             raise subprocess.CalledProcessError(return_code, "make")
         Percona.logger.notice("Compile successful!")
-        if not alternate:
-            Percona.logger.debug("Copying tools directory to %s for compiling per table defs"%self.tool_defs_dir)
-            if os.path.exists(self.tool_defs_dir):
-                shutil.rmtree(self.tool_defs_dir)
-            shutil.copytree(self.source_dir, self.tool_defs_dir)
-        
+
+    @staticmethod
+    def read_stream(stream, lines):
+        for line in iter(stream.readline, ""):
+            lines.put((stream, line))
+        lines.put((stream, None))
+
+    def follow_build(self, make, lines, stderr, bar=None):
+        open_streams = 2
+        while open_streams:
+            stream, line = lines.get()
+            if line is None:
+                open_streams = open_streams - 1
+            elif stream is make.stderr:
+                stderr.append(line)
+            elif bar is not None:
+                if Percona.BUILD_TARGET.search(line):
+                    bar()
+                if line.startswith("cd mysql-source/include && make my_config.h"):
+                    bar.text("[%s%sCompiling%s]"%(Style.BRIGHT, Fore.CYAN, Style.RESET_ALL))
+
+    def count_build_targets(self, src_dir):
+        # Recursive makes into a not yet configured tree stop the dry run early, the count is a lower bound then
+        dry_run = subprocess.run(["make", "-n"], cwd=src_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+        targets = sum(1 for line in dry_run.stdout.splitlines() if Percona.BUILD_TARGET.search(line))
+        Percona.logger.debug("Build targets in %s: %d" % (src_dir, targets))
+        return targets if targets else None
+
+    def create_workspace(self, table) -> str:
+        workspace = join(self.workspaces_dir, table)
+        Percona.logger.debug("Copying tools directory to %s for compiling table defs of %s" % (workspace, table))
+        if os.path.exists(workspace):
+            shutil.rmtree(workspace)
+        # Each table builds in its own copy of the tools, the configured and built MySQL sources are shared
+        shutil.copytree(self.source_dir, workspace, symlinks=True, ignore=shutil.ignore_patterns(Percona.MYSQL_SOURCE_DIR))
+        os.symlink(join(self.source_dir, Percona.MYSQL_SOURCE_DIR), join(workspace, Percona.MYSQL_SOURCE_DIR))
+        return workspace
+
+    def remove_workspace(self, workspace):
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    def cflags(self) -> str:
+        with open(join(self.source_dir, "Makefile")) as makefile:
+            for line in makefile:
+                if line.startswith("CFLAGS="):
+                    return line.strip()
+        return ""
+
+    def compile_table_defs(self, table, workspace, progress=True):
+        defs_h = join(workspace, "include", "table_defs.h")
+        with self.metrics.stage(self.qualified(table), "compile") as stage:
+            key = self.binary_cache.key(defs_h, table, self.cflags())
+            cached = self.binary_cache.lookup(key)
+            if cached is None:
+                # Only one job compiles a given structure, the others find its binary once the lock is released
+                with self.binary_cache.lock(key):
+                    cached = self.binary_cache.lookup(key)
+                    if cached is None:
+                        stage["cached"] = False
+                        self.metrics.add(cache_misses=1)
+                        self.compile(workspace, progress)
+                        return self.binary_cache.store(key, join(workspace, Percona.CONSTRAINTS_PARSER_BIN), table)
+            stage["cached"] = True
+            self.metrics.add(cache_hits=1)
+            Percona.logger.notice("Reusing constraints_parser built for %s%s%s (same table structure)", Fore.YELLOW, cached[1], Style.RESET_ALL)
+            return cached
 
 
     def find_ibd_file(self, database, table):
-        ibd_file = join(self.data_dir, database, table + '.ibd')
         Percona.logger.notice("Looking for innodb table file %s%s.ibd%s", Fore.YELLOW, table, Style.RESET_ALL)
-        if os.path.exists(ibd_file):
-            Percona.logger.notice("Found %s.ibd at %s%s%s", table, Fore.YELLOW, ibd_file, Style.RESET_ALL)
-            return ibd_file
-        else:
-            Percona.logger.warn("%s.ibd not found at %s", table, ibd_file)
-            ibd_file = join(self.data_dir, table + '.ibd')
+        candidates = tablespace.ibd_candidates(self.data_dir, database, table)
+        for ibd_file in candidates:
             if os.path.exists(ibd_file):
                 Percona.logger.notice("Found %s.ibd at %s%s%s", table, Fore.YELLOW, ibd_file, Style.RESET_ALL)
                 return ibd_file
-            else:
-                Percona.logger.critical("%s.ibd not found at %s. Giving up!", table, ibd_file)
-                return None
+            if ibd_file != candidates[-1]:
+                Percona.logger.warn("%s.ibd not found at %s", table, ibd_file)
+        Percona.logger.critical("%s.ibd not found at %s. Giving up!", table, candidates[-1])
+        return None
+
+    def has_ibd_file(self, database, table) -> bool:
+        return tablespace.ibd_file(self.data_dir, database, table) is not None
+
+    def tablespace_files(self, database, table) -> list:
+        # Files the pages of the table are read from, without logging like find_ibd_file does
+        ibd_file = tablespace.ibd_file(self.data_dir, database, table)
+        if ibd_file is not None:
+            return [ibd_file]
+        return [ibdata_file for ibdata_file in self.ibdata_files if os.path.exists(ibdata_file)]
 
+    def system_tablespace_routes(self, tables) -> dict:
+        # tables maps each table living in the system tablespace to its (row format, index ids)
+        routes = {}
+        for table, (row_format, indexes) in tables.items():
+            compact = row_format != 4
+            page_filter = (lambda view, offset, page_size, compact=compact: page.has_deleted_records(view, offset, page_size, compact)) if self.page_filter else None
+            index_dir = join(self.recovered_indexes_dir, table, "pages-ibdata", page.page_type_name(page.FIL_PAGE_INDEX))
+            for index_id in indexes:
+                routes[index_id] = (index_dir, page_filter)
+        return routes
 
+    def scan_system_tablespace(self, routes, tables):
+        # Index ids are unique across databases, so the routes of all of them go in one scan
+        Percona.logger.info("Scanning system tablespace %s%s%s once for %d tables", Fore.YELLOW, ", ".join(self.ibdata_files), Style.RESET_ALL, tables)
+        with self.metrics.stage(None, "ibdata") as stage:
+            scanner = PageScanner(self.ibdata_files, self.page_size)
+            scanner.route(routes)
+            stage["bytes_read"] = scanner.size
+            stage["pages"] = scanner.pages
+            stage["bytes_written"] = sum(scanner.index_pages.values()) * scanner.page_size if scanner.page_size else 0
+        self.metrics.add(skipped_pages=scanner.skipped)
 
-    def extract_innodb_pages(self, database, table, row_format=5) -> bool:
+    def extract_innodb_pages(self, database, table, row_format=5, indexes=None) -> bool:
         table_dir = join(self.recovered_indexes_dir, table)
         os.makedirs(table_dir, exist_ok=True)
+        if table in self.system_tablespace_tables:
+            Percona.logger.notice("Pages of %s%s%s already extracted from the system tablespace", Fore.YELLOW, table, Style.RESET_ALL)
+            return True
         ibd_file = self.find_ibd_file(database, table)
         if ibd_file is None:
             return False
-        self.page_parser(table_dir, table, row_format, ibd_file)
+        with self.metrics.stage(self.qualified(table), "pages") as stage:
+            if self.page_scanner == Percona.NATIVE_SCANNER:
+                self.native_page_parser(table_dir, table, row_format, ibd_file, indexes)
+            else:
+                self.page_parser(table_dir, table, row_format, ibd_file)
+                if indexes is not None:
+                    self.select_indexes(table_dir, indexes)
+                if self.page_filter:
+                    self.filter_pages(table_dir, table, row_format)
+            stage["bytes_read"] = os.path.getsize(ibd_file)
+            stage["bytes_written"] = Percona.disk_usage(table_dir)
+            stage["pages"] = stage["bytes_written"] // (self.page_size if self.page_size else page.UNIV_PAGE_SIZE)
         return True
 
+    def native_page_parser(self, table_dir, table, row_format, ibd_file, indexes=None):
+        Percona.logger.info("Scanning index pages from %s%s.ibd%s: %s"%(Fore.YELLOW, table, Style.RESET_ALL, ibd_file))
+        compact = row_format != 4
+        page_filter = (lambda view, offset, page_size: page.has_deleted_records(view, offset, page_size, compact)) if self.page_filter else None
+        # Same FIL_PAGE_INDEX/<index> layout as page_parser, with one file per index instead of one per page
+        scanner = PageScanner(ibd_file, self.page_size)
+        scanner.scan(join(table_dir, "pages-native"), indexes, page_filter)
+        self.metrics.add(skipped_pages=scanner.skipped)
+
+    def select_indexes(self, table_dir, indexes):
+        selected = { page.index_name(index_id) for index_id in indexes }
+        for index_dir in pathlib.Path(table_dir).glob('**/FIL_PAGE_INDEX/*'):
+            if index_dir.name not in selected:
+                Percona.logger.debug("Dropping pages of index %s" % index_dir.name)
+                shutil.rmtree(index_dir)
+
+    def filter_pages(self, table_dir, table, row_format):
+        compact = row_format != 4
+        page_size = self.page_size if self.page_size else page.UNIV_PAGE_SIZE
+        skipped = 0
+        for index_dir in pathlib.Path(table_dir).glob('**/FIL_PAGE_INDEX/*'):
+            for page_file in index_dir.iterdir():
+                with open(page_file, 'rb') as pages:
+                    data = pages.read()
+                if not any(page.has_deleted_records(data, offset, page_size, compact) for offset in range(0, len(data) - page_size + 1, page_size)):
+                    page_file.unlink()
+                    skipped = skipped + 1
+            if not any(index_dir.iterdir()):
+                # Nothing left in this index worth handing to constraints_parser
+                index_dir.rmdir()
+        Percona.logger.info("Skipped %d pages of %s%s%s without deleted records", skipped, Fore.YELLOW, table, Style.RESET_ALL)
+        self.metrics.add(skipped_pages=skipped)
 
     def page_parser(self, table_dir, table, row_format, ibd_file):
-        os.chdir(table_dir)
         binary = [join(self.source_dir, Percona.PAGE_PARSER_BIN), "-%d"%row_format, "-f", ibd_file]
         Percona.logger.info("Parsing deleted pages from %s%s.ibd%s: %s"%(Fore.YELLOW, table, Style.RESET_ALL, ibd_file))
-        make = subprocess.Popen(binary, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        make = subprocess.Popen(binary, cwd=table_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         return_code = make.wait()
 
-    def generate_table_defs(self, table, host, port, user, password, db):
-        include_dir = join(self.tool_defs_dir, "include")
-        os.chdir(include_dir)
+    def generate_table_defs(self, table, workspace, metadata):
+        defs_h = join(workspace, "include", "table_defs.h")
+        Percona.logger.debug("Generating %s for %s" % (defs_h, table))
+        TableDefs(table, metadata.columns[table], metadata.primary_keys.get(table)).write(defs_h)
+
+    def create_table_defs(self, table, workspace, host, port, user, password, db):
+        include_dir = join(workspace, "include")
         defs_h = join(include_dir, "table_defs.h")
         os.remove(defs_h)
         binary = [join(self.source_dir, Percona.CREATE_DEFS_BIN), "--host", host, "--port", str(port), "--user", user, "--password", password, "--db", db, "--table", table]
         with open(defs_h, 'w') as table_defs:
-            subprocess.Popen(binary, stdout=table_defs, universal_newlines=True)
+            create_defs = subprocess.Popen(binary, cwd=include_dir, stdout=table_defs, stderr=subprocess.PIPE, universal_newlines=True)
+            # table_defs.h has to be complete before it is hashed and compiled
+            _, stderr = create_defs.communicate()
+        if create_defs.returncode:
+            Percona.logger.critical("Failed generating table definitions for %s: %s", table, stderr.strip())
+            raise subprocess.CalledProcessError(create_defs.returncode, Percona.CREATE_DEFS_BIN)
 
 
-    def extract_data(self, table, row_format):
-        table_dir = join(self.recovered_indexes_dir, table)
+    def table_dir(self, table) -> str:
+        return join(self.recovered_indexes_dir, table)
+
+    def extract_data(self, table, row_format, constraints_parser, parser_table=None):
+        return self.save_outputs(table, self.parse_indexes(table, row_format, constraints_parser), parser_table)
+
+    def parse_indexes(self, table, row_format, constraints_parser) -> list:
+        table_dir = self.table_dir(table)
         search = '**/FIL_PAGE_INDEX/*'
-        extracted = pathlib.Path(table_dir).glob(search)
-        os.chdir(table_dir)
-        Percona.TABLES = Percona.TABLES + 1
+        extracted = sorted(item for item in pathlib.Path(table_dir).glob(search) if not str(item).endswith('FIL_PAGE_INDEX'))
+        self.count_scanned(len(extracted))
         Percona.logger.info("Scanning for any deleted records from indexes: [%s%s%s%s]", Style.BRIGHT, Fore.BLUE, table_dir, Style.RESET_ALL)
-        for item in extracted:
-            if not str(item).endswith('FIL_PAGE_INDEX'):
-                Percona.INDEXES = Percona.INDEXES + 1
-                binary = [join(self.tool_defs_dir, Percona.CONSTRAINTS_PARSER_BIN), "-%d"%row_format, "-D", "-f", item]
-                tsv_file = "%s%s.tsv"%(table,os.path.basename(item))
-                with open(tsv_file, "w") as tsv:
-                    make = subprocess.Popen(binary, stdout=tsv, stderr=subprocess.PIPE)
-                _, stderr = make.communicate()
-                if os.stat(tsv_file).st_size == 0:
-                    Percona.logger.warn("[%s%s%s%s] - No deleted records found", Style.BRIGHT, Fore.BLUE, os.path.basename(item), Style.RESET_ALL)
-                    os.remove(tsv_file)
+        with self.metrics.stage(self.qualified(table), "parse") as stage:
+            stage["bytes_read"] = Percona.disk_usage(table_dir)
+            stage["pages"] = stage["bytes_read"] // (self.page_size if self.page_size else page.UNIV_PAGE_SIZE)
+            # From here on pages are deleted as they get parsed
+            pathlib.Path(table_dir, Percona.PARSE_STARTED).touch()
+            with ThreadPoolExecutor(max_workers=self.parser_jobs) as executor:
+                # Results come back in index order whatever order the parsers finish in, same as a serial run
+                results = list(executor.map(lambda item: self.parse_index(table_dir, table, item, row_format, constraints_parser), extracted))
+            parsed = [(index, tsv_file, stderr) for index, tsv_file, stderr, _ in results]
+            stage["bytes_written"] = sum(os.path.getsize(tsv_file) for _, tsv_file, _ in parsed if tsv_file)
+            # Rows are counted as they are written, the files are not read again
+            stage["records"] = sum(rows for _, _, _, rows in results)
+        return parsed
+
+    def count_scanned(self, indexes):
+        self.metrics.add(tables=1, indexes=indexes)
+
+    def parse_index(self, table_dir, table, item, row_format, constraints_parser):
+        binary = [constraints_parser, "-%d"%row_format, "-D", "-f", item]
+        if self.compressor is not None:
+            tsv_file, stderr, rows = self.parse_compressed(table_dir, table, item, binary)
+        else:
+            tsv_file = join(table_dir, "%s%s.tsv"%(table,os.path.basename(item)))
+            _, stderr, rows = self.run_parser(binary, table_dir, tsv_file)
+        # Pages of the index are not needed anymore, the space goes back before the other indexes are parsed
+        if os.path.isdir(item):
+            shutil.rmtree(item, ignore_errors=True)
+        else:
+            os.remove(item)
+        return os.path.basename(item), tsv_file, stderr.decode('utf-8'), rows
+
+    def parse_compressed(self, table_dir, table, item, binary):
+        # Rows go straight through the compressor to where they are kept, no file is created when there are none
+        recovered_tsv_dir = join(self.recovered_dir, table)
+        os.makedirs(recovered_tsv_dir, exist_ok=True)
+        tsv_file = self.compressor.name(join(recovered_tsv_dir, "%s%s.tsv"%(table,os.path.basename(item))))
+        written, stderr, rows = self.run_parser(binary, table_dir, tsv_file)
+        if not written and os.path.exists(tsv_file):
+            # Left behind by an earlier, interrupted run
+            os.remove(tsv_file)
+        return tsv_file if written else None, stderr, rows
+
+    def run_parser(self, binary, table_dir, tsv_file):
+        # stderr goes to a file, so that the parser never blocks on it while its rows are being read
+        with tempfile.TemporaryFile() as stderr:
+            make = subprocess.Popen(binary, cwd=table_dir, stdout=subprocess.PIPE, stderr=stderr)
+            rows = LineCounter(make.stdout)
+            try:
+                if self.compressor is not None:
+                    written = self.compressor.stream(rows, tsv_file)
                 else:
-                    Percona.logger.success("[%s%s%s%s] - Deleted records found%s", Style.BRIGHT, Fore.BLUE, os.path.basename(item), Fore.GREEN, Style.RESET_ALL)
-                    # Create directory to save recovered data
-                    recovered_tsv_dir = join(self.recovered_dir, table)
-                    os.makedirs(recovered_tsv_dir, exist_ok=True)
-                    recovered_data_file = join(recovered_tsv_dir, tsv_file)
-                    os.rename(join(table_dir, tsv_file), recovered_data_file)
-
-                    # Save load data sql query
-                    default_dir = join(self.workdir, "dumps", "default", table)
-                    stderr = re.sub(default_dir, recovered_data_file, stderr.decode('utf-8'))
-                    stderr = re.sub("LOAD DATA INFILE", "LOAD DATA LOCAL INFILE", stderr)
-                    stderr = re.sub("REPLACE", "IGNORE", stderr)
-
-                    # Save summary
-                    Percona.LOAD_SQL_QUERIES.append(stderr)
-                    Percona.RECOVERED_TABLES.add(table)
-                    Percona.RECOVERED_INDEXES = Percona.RECOVERED_INDEXES + 1
-        shutil.rmtree(table_dir)
-        shutil.rmtree(self.recovered_indexes_dir)
+                    with open(tsv_file, 'wb') as tsv:
+                        shutil.copyfileobj(rows, tsv, Compressor.CHUNK)
+                    written = True
+            finally:
+                make.stdout.close()
+                make.wait()
+            stderr.seek(0)
+            return written, stderr.read(), rows.lines
+
+    def parse_started(self, table) -> bool:
+        return os.path.exists(join(self.table_dir(table), Percona.PARSE_STARTED))
+
+    def save_outputs(self, table, parsed, parser_table=None) -> list:
+        queries = []
+        with self.metrics.stage(self.qualified(table), "outputs") as stage:
+            stage["bytes_written"] = sum(os.path.getsize(tsv_file) for _, tsv_file, _ in parsed if tsv_file)
+            for index, tsv_file, stderr in parsed:
+                query = self.save_recovered_data(table, index, tsv_file, stderr, parser_table)
+                if query is not None:
+                    queries.append(query)
+        # Only this table's pages, other tables may still be parsing theirs
+        shutil.rmtree(self.table_dir(table), ignore_errors=True)
+        return queries
+
+    def save_recovered_data(self, table, index, tsv_file, stderr, parser_table=None):
+        if tsv_file is None or os.stat(tsv_file).st_size == 0:
+            Percona.logger.warn("[%s%s%s%s] - No deleted records found", Style.BRIGHT, Fore.BLUE, index, Style.RESET_ALL)
+            if tsv_file is not None:
+                os.remove(tsv_file)
+            return None
+        Percona.logger.success("[%s%s%s%s] - Deleted records found%s", Style.BRIGHT, Fore.BLUE, index, Fore.GREEN, Style.RESET_ALL)
+        # Create directory to save recovered data
+        recovered_tsv_dir = join(self.recovered_dir, table)
+        os.makedirs(recovered_tsv_dir, exist_ok=True)
+        recovered_data_file = join(recovered_tsv_dir, os.path.basename(tsv_file))
+        if tsv_file != recovered_data_file:
+            # A plain rename fails when the intermediate files are on another volume
+            shutil.move(tsv_file, recovered_data_file)
+
+        # Save load data sql query
+        stderr = re.sub(r"'[^']*/dumps/default/[^']*'", "'%s'" % recovered_data_file, stderr)
+        stderr = re.sub("LOAD DATA INFILE", "LOAD DATA LOCAL INFILE", stderr)
+        stderr = re.sub("REPLACE", "IGNORE", stderr)
+        if self.database or (parser_table is not None and parser_table != table):
+            # Binary is shared with a table of the same structure, only the target table differs. Statements
+            # name the database as well when several are recovered, as they all go to the same SQL file
+            stderr = re.sub(r"INTO TABLE `?%s`?" % re.escape(parser_table if parser_table else table), lambda _: "INTO TABLE %s" % self.quoted(table), stderr)
 
+        # Save summary
+        self.count_recovered(table, [stderr])
+        return stderr
+
+    def count_recovered(self, table, queries):
+        if not queries:
+            return
+        with self.metrics.lock:
+            self.metrics.load_sql_queries.extend(queries)
+            self.metrics.recovered_tables.add(self.qualified(table))
+        self.metrics.add(recovered_indexes=len(queries))
+
+    def replace_queries(self, queries, replacements):
+        with self.metrics.lock:
+            self.metrics.load_sql_queries[:] = [query for query in self.metrics.load_sql_queries if query not in queries]
+            self.metrics.load_sql_queries.extend(replacements)
+
+    def count_merged(self, queries, merged_query, conflicts):
+        # The single statement of the merged file replaces those of every index of the table
+        self.replace_queries(queries, [merged_query])
+        self.metrics.add(merged_tables=1, conflicting_rows=conflicts)
+
+    def count_missing(self, queries, missing_queries, present, missing):
+        self.replace_queries(queries, missing_queries)
+        self.metrics.add(present_rows=present, missing_rows=missing)
 
     def print_summary(self):
         Percona.logger.info("===============================================")
         Percona.logger.info("                    SUMMARY                    ")
         Percona.logger.info("===============================================")
-        Percona.logger.info("  Tables  Scanned: %s%d%s  ", Fore.CYAN, Percona.TABLES, Style.RESET_ALL)
-        Percona.logger.info("  Indexes Scanned: %s%d%s  ", Fore.CYAN, Percona.INDEXES, Style.RESET_ALL)
+        Percona.logger.info("  Tables  Scanned: %s%d%s  ", Fore.CYAN, self.metrics.tables, Style.RESET_ALL)
+        Percona.logger.info("  Indexes Scanned: %s%d%s  ", Fore.CYAN, self.metrics.indexes, Style.RESET_ALL)
+        Percona.logger.info("  Parser Builds  : %s%d compiled, %d cached%s  ", Fore.CYAN, self.metrics.cache_misses, self.metrics.cache_hits, Style.RESET_ALL)
+        Percona.logger.info("  Pages  Skipped : %s%d%s (no deleted records)  ", Fore.CYAN, self.metrics.skipped_pages, Style.RESET_ALL)
+        for name, totals in self.metrics.totals().items():
+            Percona.logger.info("  Stage %-9s: %s%.2fs%s wall, %.2fs CPU, %.2fs child CPU (%d runs)  ", name, Fore.CYAN, totals["wall"], Style.RESET_ALL, totals["cpu"], totals["child_cpu"], totals["count"])
         Percona.logger.info("-----------------------------------------------")
-        Percona.logger.info("  Tables Recovered: %s%d%s  ", Fore.CYAN, len(Percona.RECOVERED_TABLES), Style.RESET_ALL)
-        Percona.logger.info("  Indexes Recovered: %s%d%s  ", Fore.CYAN, Percona.RECOVERED_INDEXES, Style.RESET_ALL)
-        if Percona.RECOVERED_INDEXES > 0:
+        Percona.logger.info("  Tables Recovered: %s%d%s  ", Fore.CYAN, len(self.metrics.recovered_tables), Style.RESET_ALL)
+        Percona.logger.info("  Indexes Recovered: %s%d%s  ", Fore.CYAN, self.metrics.recovered_indexes, Style.RESET_ALL)
+        if self.metrics.failed_tables:
+            Percona.logger.info("  Tables Failed    : %s%d%s  ", Fore.RED, len(self.metrics.failed_tables), Style.RESET_ALL)
+            for item, error in sorted(self.metrics.failed_tables.items()):
+                Percona.logger.error("  %s%s%s: %s  ", Fore.YELLOW, item, Style.RESET_ALL, error)
+        if self.metrics.merged_tables > 0:
+            Percona.logger.info("  Tables Merged    : %s%d%s (%d conflicting rows)  ", Fore.CYAN, self.metrics.merged_tables, Style.RESET_ALL, self.metrics.conflicting_rows)
+        if self.metrics.present_rows + self.metrics.missing_rows > 0:
+            Percona.logger.info("  Rows Missing     : %s%d%s (%d still in the live tables)  ", Fore.CYAN, self.metrics.missing_rows, Style.RESET_ALL, self.metrics.present_rows)
+        if self.metrics.recovered_indexes > 0:
             Percona.logger.info("  Recovered Rows from Tables:  ")
-            for item in Percona.RECOVERED_TABLES:
+            for item in self.metrics.recovered_tables:
                 Percona.logger.info("  %s%s%s%s  ", Style.BRIGHT, Fore.MAGENTA, item, Style.RESET_ALL) 
             Percona.logger.info("")
             Percona.logger.info("Please go over the recovered data under %s%s/<table-name>%s  and then execute the following SQL commands (if required)", Fore.RED, self.recovered_dir, Style.RESET_ALL)
-            Percona.logger.info("If multiple files present under the same table name (directory), there might be conflicting rows,")
-            Percona.logger.info("so, please go over the files, decide (and edit) each file before loading them into database")
-            Percona.logger.info("%sTIP: When multiple files found under a table, prefer the one that has most entries%s", Fore.CYAN, Style.RESET_ALL)
+            if self.metrics.merged_tables > 0:
+                Percona.logger.info("Rows of merged tables are in <table-name>.merged.tsv, one per primary key. Other versions of the same rows")
+                Percona.logger.info("are kept in <table-name>.conflicts.tsv, please go over them before loading the data into database")
+            else:
+                Percona.logger.info("If multiple files present under the same table name (directory), there might be conflicting rows,")
+                Percona.logger.info("so, please go over the files, decide (and edit) each file before loading them into database")
+                Percona.logger.info("%sTIP: When multiple files found under a table, prefer the one that has most entries%s", Fore.CYAN, Style.RESET_ALL)
             Percona.logger.info("%sQueries to load data into database: %s", Style.BRIGHT, Fore.CYAN)
             load_queries_file = join(self.recovered_dir, "load_recovered_data.sql")
             with open(load_queries_file, 'w') as lqf:
-                for item in Percona.LOAD_SQL_QUERIES:
-                    Percona.logger.warning("%s%s%s%s  ", Style.BRIGHT, Fore.BLUE, item, Style.RESET_ALL)
-                    lqf.write("%s\n" % item)
+                for item in self.metrics.load_sql_queries:
+                    statement = Percona.sql_statement(item)
+                    Percona.logger.warning("%s%s%s%s  ", Style.BRIGHT, Fore.BLUE, statement, Style.RESET_ALL)
+                    lqf.write("%s\n" % statement)
             Percona.logger.info("")
             Percona.logger.info("These queries can be found at %s%s%s", Fore.RED, load_queries_file, Style.RESET_ALL)
             Percona.logger.info("")
         Percona.logger.info("-----------------------------------------------")
 
+    @staticmethod
+    def disk_usage(path) -> int:
+        return sum(os.path.getsize(join(root, name)) for root, _, names in os.walk(path) for name in names)
 
+    @staticmethod
+    def sql_statement(query) -> str:
+        load_data = LoadData(query)
+        if not Compressor.compressed(load_data.infile):
+            return query
+        # LOAD DATA cannot read compressed files: the mysql client decompresses them into a named pipe and loads from it
+        fifo = shlex.quote(Compressor.stem(load_data.infile) + ".fifo")
+        return "system rm -f %s && mkfifo %s && (gzip -dc %s > %s &)\n%s\nsystem rm -f %s" % (fifo, fifo, shlex.quote(load_data.infile), fifo,
+                                                                                          load_data.with_infile(Compressor.stem(load_data.infile) + ".fifo").rstrip("\n"), fifo)
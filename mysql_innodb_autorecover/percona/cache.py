@@ -0,0 +1,95 @@
+import os
+import re
+import fcntl
+import shutil
+import hashlib
+import tempfile
+import logging, verboselogs
+
+from os.path import join, exists
+from mysql_innodb_autorecover import APPVSN, PERCONA_URL
+from colorama import Fore, Style
+
+verboselogs.install()
+
+class BinaryCache:
+    """Content addressed store of compiled constraints_parser binaries, keyed by table structure"""
+    logger     = logging.getLogger(__module__)
+    BINARY     = "constraints_parser"
+    TABLE_FILE = "table"
+
+    def __init__(self, cache_dir) -> None:
+        super().__init__()
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, defs_h, table, cflags) -> str:
+        with open(defs_h, 'r') as defs:
+            content = defs.read()
+        # The first name in table_defs.h is the table name, mask it out
+        content = re.sub(r'name:\s*"%s"' % re.escape(table), 'name: ""', content, count=1)
+        digest = hashlib.sha256()
+        for item in (PERCONA_URL, APPVSN, cflags, content):
+            digest.update(item.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def lookup(self, key):
+        entry = join(self.cache_dir, key)
+        binary = join(entry, BinaryCache.BINARY)
+        table_file = join(entry, BinaryCache.TABLE_FILE)
+        if not (exists(binary) and exists(table_file)):
+            return None
+        with open(table_file, 'r') as built_for:
+            BinaryCache.logger.debug("Cached constraints_parser found for key %s" % key)
+            return binary, built_for.read().strip()
+
+    def lock(self, key):
+        # Held while a key is compiled, so that tables of the same structure in other jobs or processes wait and reuse the binary
+        entry = join(self.cache_dir, key)
+        os.makedirs(entry, exist_ok=True)
+        return FileLock(join(entry, "lock"))
+
+    def store(self, key, binary, table):
+        entry = join(self.cache_dir, key)
+        os.makedirs(entry, exist_ok=True)
+        # Write under a temporary name unique to this call and rename, so that a concurrent store never sees a partial binary
+        cached = join(entry, BinaryCache.BINARY)
+        staging = BinaryCache.staging(entry, BinaryCache.BINARY)
+        shutil.copy2(binary, staging)
+        table_file = join(entry, BinaryCache.TABLE_FILE)
+        table_staging = BinaryCache.staging(entry, BinaryCache.TABLE_FILE)
+        with open(table_staging, 'w') as built_for:
+            built_for.write(table)
+        os.replace(table_staging, table_file)
+        os.replace(staging, cached)
+        BinaryCache.logger.info("Cached constraints_parser for %s%s%s under %s", Fore.YELLOW, table, Style.RESET_ALL, entry)
+        return cached, table
+
+    @staticmethod
+    def staging(entry, name) -> str:
+        handle, path = tempfile.mkstemp(prefix=name + ".", dir=entry)
+        os.close(handle)
+        return path
+
+
+class FileLock:
+    """Exclusive advisory lock on a file, shared by every process using the same cache directory"""
+    logger = logging.getLogger(__module__)
+
+    def __init__(self, path) -> None:
+        super().__init__()
+        self.path = path
+
+    def __enter__(self):
+        self.handle = open(self.path, 'w')
+        try:
+            fcntl.flock(self.handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            FileLock.logger.notice("Waiting for another job or process holding %s%s%s", Fore.YELLOW, self.path, Style.RESET_ALL)
+            fcntl.flock(self.handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.handle, fcntl.LOCK_UN)
+        self.handle.close()
@@ -0,0 +1,90 @@
+import gzip
+import shutil
+import subprocess
+import logging, verboselogs
+
+from os.path import getsize
+from mysql_innodb_autorecover.percona.load_data import LoadData
+
+verboselogs.install()
+
+class LineCounter:
+    """Reads through a binary stream, counting the lines that go by"""
+
+    def __init__(self, source) -> None:
+        super().__init__()
+        self.source = source
+        self.lines = 0
+
+    def read(self, size=-1):
+        chunk = self.source.read(size)
+        self.lines = self.lines + chunk.count(b"\n")
+        return chunk
+
+
+class Compressor:
+    """Streams recovered rows into gzip files as they are produced, through pigz when more than one thread is asked for"""
+    logger = logging.getLogger(__module__)
+    SUFFIX = ".gz"
+    PIGZ   = "pigz"
+    CHUNK  = 1 << 20
+    # Assumed ratio of recovered rows to their compressed size, for sizing work where only the compressed size is known
+    RATIO  = 8
+
+    def __init__(self, level=6, threads=1) -> None:
+        super().__init__()
+        self.level = min(9, max(1, int(level)))
+        self.threads = max(1, int(threads))
+        self.pigz = shutil.which(Compressor.PIGZ) if self.threads > 1 else None
+        if self.threads > 1 and self.pigz is None:
+            Compressor.logger.warn("%s not found, compressing with a single thread" % Compressor.PIGZ)
+
+    def stream(self, source, path) -> bool:
+        # Everything read from source goes to path compressed. The file is only created once there is data to write
+        chunk = source.read(Compressor.CHUNK)
+        if not chunk:
+            return False
+        if self.pigz is None:
+            with gzip.open(path, 'wb', compresslevel=self.level) as output:
+                output.write(chunk)
+                shutil.copyfileobj(source, output, Compressor.CHUNK)
+            return True
+        with open(path, 'wb') as output:
+            pigz = subprocess.Popen([self.pigz, "-%d" % self.level, "-p", str(self.threads), "-c"], stdin=subprocess.PIPE, stdout=output)
+            try:
+                pigz.stdin.write(chunk)
+                shutil.copyfileobj(source, pigz.stdin, Compressor.CHUNK)
+            finally:
+                pigz.stdin.close()
+                return_code = pigz.wait()
+        if return_code != 0:
+            raise Exception("%s failed compressing %s with return code %d" % (Compressor.PIGZ, path, return_code))
+        return True
+
+    def open(self, path, mode='wt'):
+        # For files written a line at a time, like merged and missing rows
+        return gzip.open(path, mode, compresslevel=self.level, encoding=LoadData.ENCODING, errors=LoadData.ERRORS)
+
+    def name(self, path) -> str:
+        return path + Compressor.SUFFIX
+
+    @staticmethod
+    def compressed(path) -> bool:
+        return path.endswith(Compressor.SUFFIX)
+
+    @staticmethod
+    def reader(path, mode='r'):
+        # Recovered files are read the same way whether they were compressed or not
+        if 'b' in mode:
+            return gzip.open(path, mode) if Compressor.compressed(path) else open(path, mode)
+        if Compressor.compressed(path):
+            return gzip.open(path, mode + 't', encoding=LoadData.ENCODING, errors=LoadData.ERRORS)
+        return open(path, mode, encoding=LoadData.ENCODING, errors=LoadData.ERRORS)
+
+    @staticmethod
+    def stem(path) -> str:
+        return path[:-len(Compressor.SUFFIX)] if Compressor.compressed(path) else path
+
+    @staticmethod
+    def data_size(path) -> int:
+        return getsize(path) * (Compressor.RATIO if Compressor.compressed(path) else 1)
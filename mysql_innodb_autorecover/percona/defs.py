@@ -0,0 +1,119 @@
+import re
+
+class TableDefs:
+    """Renders table_defs.h for constraints_parser from column metadata, laid out the way create_defs.pl does"""
+    INT_TYPES  = { "tinyint": 1, "smallint": 2, "mediumint": 3, "int": 4, "integer": 4, "bigint": 8 }
+    TEXT_TYPES = { "tinytext": 255, "text": 65535, "mediumtext": 16777215, "longtext": 4294967295 }
+    BLOB_TYPES = { "tinyblob": 255, "blob": 65535, "mediumblob": 16777215, "longblob": 4294967295 }
+    # Bytes used by the leftover digits of a DECIMAL, nine full digits take four bytes
+    DIG2BYTES  = [0, 1, 1, 2, 2, 3, 3, 4, 4, 4]
+    ENUM_VALUE = re.compile(r"'((?:[^']|'')*)'")
+
+    def __init__(self, table, columns, primary_key=None) -> None:
+        super().__init__()
+        self.table = table
+        self.columns = sorted(columns, key=lambda column: int(column["ORDINAL_POSITION"]))
+        self.primary_key = list(primary_key) if primary_key else []
+
+    def render(self) -> str:
+        by_name = { column["COLUMN_NAME"]: column for column in self.columns }
+        fields = []
+        # Clustered index records are stored as: primary key, transaction id, roll pointer, remaining columns
+        if self.primary_key:
+            fields += [self.field(by_name[name]) for name in self.primary_key]
+        else:
+            fields.append(self.internal_field("DB_ROW_ID", 6))
+        fields.append(self.internal_field("DB_TRX_ID", 6))
+        fields.append(self.internal_field("DB_ROLL_PTR", 7))
+        fields += [self.field(column) for column in self.columns if column["COLUMN_NAME"] not in self.primary_key]
+
+        lines = ["#ifndef table_defs_h", "#define table_defs_h", "", "// Table definitions", "table_def_t table_definitions[] = {"]
+        lines += ["\t{", '\t\tname: "%s",' % TableDefs.c_string(self.table), "\t\t{"]
+        for field in fields:
+            lines += field
+        lines += ["\t\t\t{ type: FT_NONE }", "\t\t}", "\t},", "};", "", "#endif", ""]
+        return "\n".join(lines)
+
+    def write(self, defs_h):
+        with open(defs_h, 'w') as table_defs:
+            table_defs.write(self.render())
+
+    def internal_field(self, name, length) -> list:
+        return TableDefs.field_lines("", name, [("type", "FT_INTERNAL"), ("fixed_length", length)], False)
+
+    def field(self, column) -> list:
+        return TableDefs.field_lines(column["COLUMN_TYPE"], column["COLUMN_NAME"], TableDefs.attributes(column), column["IS_NULLABLE"] == "YES")
+
+    @staticmethod
+    def field_lines(comment, name, attributes, can_be_null) -> list:
+        lines = ["\t\t\t{ /* %s */" % comment.replace("*/", "* /"), '\t\t\t\tname: "%s",' % TableDefs.c_string(name)]
+        lines += ["\t\t\t\t%s: %s," % (key, value) for key, value in attributes]
+        lines += ["", "\t\t\t\tcan_be_null: %s" % ("TRUE" if can_be_null else "FALSE"), "\t\t\t},"]
+        return lines
+
+    @staticmethod
+    def attributes(column) -> list:
+        data_type = column["DATA_TYPE"].lower()
+        column_type = column["COLUMN_TYPE"].lower()
+        length = int(column["CHARACTER_MAXIMUM_LENGTH"] or 0)
+        octets = int(column["CHARACTER_OCTET_LENGTH"] or 0)
+
+        if data_type in TableDefs.INT_TYPES:
+            return [("type", "FT_UINT" if "unsigned" in column_type else "FT_INT"), ("fixed_length", TableDefs.INT_TYPES[data_type]), ("has_limits", "FALSE")]
+        if data_type == "float":
+            return [("type", "FT_FLOAT"), ("fixed_length", 4)]
+        if data_type in ("double", "real"):
+            return [("type", "FT_DOUBLE"), ("fixed_length", 8)]
+        if data_type in ("decimal", "numeric"):
+            precision, scale = int(column["NUMERIC_PRECISION"]), int(column["NUMERIC_SCALE"] or 0)
+            return [("type", "FT_DECIMAL"), ("fixed_length", TableDefs.decimal_length(precision, scale)),
+                    ("decimal_precision", precision), ("decimal_digits", scale)]
+        if data_type == "char":
+            if octets == length:
+                return [("type", "FT_CHAR"), ("fixed_length", length)]
+            # Multi-byte character sets store CHAR as variable length in COMPACT rows
+            return [("type", "FT_CHAR"), ("min_length", length), ("max_length", octets)]
+        if data_type == "varchar":
+            return [("type", "FT_CHAR"), ("min_length", 0), ("max_length", octets)]
+        if data_type == "binary":
+            return [("type", "FT_BIN"), ("fixed_length", length)]
+        if data_type == "varbinary":
+            return [("type", "FT_BIN"), ("min_length", 0), ("max_length", length)]
+        if data_type in TableDefs.TEXT_TYPES:
+            return [("type", "FT_TEXT"), ("min_length", 0), ("max_length", TableDefs.TEXT_TYPES[data_type])]
+        if data_type == "date":
+            return [("type", "FT_DATE"), ("fixed_length", 3)]
+        if data_type == "time":
+            return [("type", "FT_TIME"), ("fixed_length", 3)]
+        if data_type == "datetime":
+            return [("type", "FT_DATETIME"), ("fixed_length", 8)]
+        if data_type == "timestamp":
+            return [("type", "FT_TIMESTAMP"), ("fixed_length", 4)]
+        if data_type == "year":
+            return [("type", "FT_UINT"), ("fixed_length", 1), ("has_limits", "FALSE")]
+        if data_type == "enum":
+            values = TableDefs.enum_values(column["COLUMN_TYPE"])
+            return [("type", "FT_ENUM"), ("fixed_length", 1 if len(values) < 256 else 2), ("enum_values_count", len(values)),
+                    ("enum_values", "{ %s }" % ", ".join('"%s"' % TableDefs.c_string(value) for value in values))]
+        if data_type == "set":
+            values = TableDefs.enum_values(column["COLUMN_TYPE"])
+            length = (len(values) + 7) // 8
+            return [("type", "FT_SET"), ("fixed_length", 8 if length > 4 else length), ("set_values_count", len(values)),
+                    ("set_values", "{ %s }" % ", ".join('"%s"' % TableDefs.c_string(value) for value in values))]
+        if data_type == "bit":
+            return [("type", "FT_BIT"), ("fixed_length", (int(column["NUMERIC_PRECISION"] or 1) + 7) // 8)]
+        # BLOB family and anything stored like one (JSON, spatial types)
+        return [("type", "FT_BLOB"), ("min_length", 0), ("max_length", TableDefs.BLOB_TYPES.get(data_type, 4294967295))]
+
+    @staticmethod
+    def decimal_length(precision, scale) -> int:
+        integer = precision - scale
+        return (integer // 9) * 4 + TableDefs.DIG2BYTES[integer % 9] + (scale // 9) * 4 + TableDefs.DIG2BYTES[scale % 9]
+
+    @staticmethod
+    def enum_values(column_type) -> list:
+        return [value.replace("''", "'") for value in TableDefs.ENUM_VALUE.findall(column_type)]
+
+    @staticmethod
+    def c_string(value) -> str:
+        return value.replace("\\", "\\\\").replace('"', '\\"')
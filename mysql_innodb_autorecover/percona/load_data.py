@@ -0,0 +1,68 @@
+import re
+
+class LoadData:
+    """LOAD DATA statement printed by constraints_parser, parsed for the file layout it describes"""
+    INFILE   = re.compile(r"INFILE\s+'((?:[^'\\]|\\.)*)'")
+    TABLE    = re.compile(r"INTO\s+TABLE\s+(?:`?([^`\s.]+)`?\.)?`?([^`\s]+)`?")
+    FIELDS   = re.compile(r"FIELDS\s+TERMINATED\s+BY\s+'((?:[^'\\]|\\.)*)'")
+    ENCLOSED = re.compile(r"ENCLOSED\s+BY\s+'((?:[^'\\]|\\.)*)'")
+    LINES    = re.compile(r"LINES\s+STARTING\s+BY\s+'((?:[^'\\]|\\.)*)'")
+    COLUMNS  = re.compile(r"\(([^()]*)\)\s*(?:SET\b|;|$)")
+    ESCAPES  = { "t": "\t", "n": "\n", "r": "\r", "0": "\0", "\\": "\\", "'": "'", '"': '"' }
+    NULL     = "NULL"
+    # constraints_parser writes raw column bytes, those that are not UTF-8 are carried through unchanged
+    ENCODING = "utf-8"
+    ERRORS   = "surrogateescape"
+
+    def __init__(self, statement) -> None:
+        super().__init__()
+        self.statement = statement
+        self.infile = LoadData.unescape(LoadData.search(LoadData.INFILE, statement, ""))
+        table = LoadData.TABLE.search(statement)
+        # Statements name the database too when several databases are recovered
+        self.database, self.table = table.groups() if table else (None, None)
+        self.fields_terminated = LoadData.unescape(LoadData.search(LoadData.FIELDS, statement, "\\t"))
+        self.enclosed = LoadData.unescape(LoadData.search(LoadData.ENCLOSED, statement, ""))
+        self.lines_starting = LoadData.unescape(LoadData.search(LoadData.LINES, statement, ""))
+        lines = LoadData.LINES.search(statement)
+        columns = LoadData.COLUMNS.search(statement, lines.end() if lines else 0)
+        self.columns = [column.strip().strip("`") for column in columns.group(1).split(",")] if columns else []
+
+    @property
+    def name(self) -> str:
+        return "%s.%s" % (self.database, self.table) if self.database else self.table
+
+    def with_infile(self, infile) -> str:
+        return LoadData.INFILE.sub(lambda match: "INFILE '%s'" % infile.replace("\\", "\\\\").replace("'", "\\'"), self.statement, count=1)
+
+    def load_statement(self, infile=None) -> str:
+        # The LOAD DATA statement alone, without the SET statements printed around it, for executing over a connection
+        statement = self.with_infile(infile) if infile else self.statement
+        statement = statement[statement.find("LOAD DATA"):]
+        return statement.split(";", 1)[0].strip()
+
+    def rows(self, data):
+        # Yields the raw line with its fields, skipping lines LOAD DATA would skip as well
+        for line in data:
+            if not line.startswith(self.lines_starting):
+                continue
+            yield line, line[len(self.lines_starting):].rstrip("\n").split(self.fields_terminated)
+
+    def value(self, field):
+        # Field as the server would read it: None for NULL, enclosing quotes and escapes removed
+        if field == LoadData.NULL:
+            return None
+        if self.enclosed and len(field) > 1 and field.startswith(self.enclosed) and field.endswith(self.enclosed):
+            field = field[len(self.enclosed):-len(self.enclosed)]
+        return LoadData.unescape(field)
+
+    @staticmethod
+    def search(pattern, statement, default=None):
+        match = pattern.search(statement)
+        return match.group(1) if match else default
+
+    @staticmethod
+    def unescape(value):
+        if value is None:
+            return None
+        return re.sub(r"\\(.)", lambda match: LoadData.ESCAPES.get(match.group(1), match.group(1)), value)
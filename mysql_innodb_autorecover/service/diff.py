@@ -0,0 +1,120 @@
+import os
+import logging, verboselogs
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from colorama import Fore, Style
+from mysql.connector import Error
+from mysql_innodb_autorecover.percona.load_data import LoadData
+from mysql_innodb_autorecover.percona.compress import Compressor
+
+verboselogs.install()
+
+class Differ:
+    """Drops recovered rows whose primary key is still present in the live table, leaving only the rows actually missing"""
+    logger  = logging.getLogger(__module__)
+    MISSING = "%s.missing.tsv"
+
+    def __init__(self, mysql, database, table, primary_key, batch=1000, jobs=1, compressor=None) -> None:
+        super().__init__()
+        self.mysql = mysql
+        self.database = database
+        self.table = table
+        self.primary_key = list(primary_key) if primary_key else []
+        self.batch = max(1, int(batch))
+        self.jobs = max(1, int(jobs))
+        self.compressor = compressor
+        self.matched = 0
+        self.missing = 0
+
+    def diff(self, queries) -> list:
+        filtered = []
+        for query in queries:
+            load_data = LoadData(query)
+            key = [load_data.columns.index(column) for column in self.primary_key if column in load_data.columns]
+            if not self.primary_key or len(key) != len(self.primary_key):
+                Differ.logger.warn("Primary key of %s%s%s not found in %s, keeping all of its rows", Fore.YELLOW, self.table, Style.RESET_ALL, load_data.infile)
+                filtered.append(query)
+                continue
+            missing_file = Differ.MISSING % os.path.splitext(Compressor.stem(load_data.infile))[0]
+            if self.compressor is not None:
+                missing_file = self.compressor.name(missing_file)
+            if self.diff_file(load_data, key, missing_file):
+                filtered.append(load_data.with_infile(missing_file))
+            else:
+                os.remove(missing_file)
+        Differ.logger.success("Compared %s%s%s with the live table: %s%d%s rows still present, %s%d%s missing", Fore.YELLOW, self.table, Style.RESET_ALL,
+                              Fore.CYAN, self.matched, Style.RESET_ALL, Fore.CYAN, self.missing, Style.RESET_ALL)
+        return filtered
+
+    def diff_file(self, load_data, key, missing_file) -> int:
+        missing = self.missing
+        output_file = self.compressor.open(missing_file) if self.compressor is not None else open(missing_file, 'w', encoding=LoadData.ENCODING, errors=LoadData.ERRORS)
+        with Compressor.reader(load_data.infile) as data, output_file as output, ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            # A few batches in flight per job keeps the pool busy without reading the whole file ahead
+            pending = deque()
+            for batch in self.batches(load_data, data, key):
+                pending.append((batch, executor.submit(self.lookup, { row_key for _, row_key in batch if row_key is not None })))
+                if len(pending) >= 2 * self.jobs:
+                    self.write(output, *pending.popleft())
+            while pending:
+                self.write(output, *pending.popleft())
+        return self.missing - missing
+
+    def batches(self, load_data, data, key):
+        batch = []
+        for line, fields in load_data.rows(data):
+            values = tuple(load_data.value(fields[position]) for position in key) if len(fields) > max(key) else None
+            # Rows without a usable key cannot be looked up and are kept
+            batch.append((line, values if values is not None and None not in values else None))
+            if len(batch) >= self.batch:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def lookup(self, keys) -> set:
+        if not keys:
+            return set()
+        keys = list(keys)
+        columns = ", ".join("`%s`" % column.replace("`", "``") for column in self.primary_key)
+        table = "`%s`.`%s`" % (self.database.replace("`", "``"), self.table.replace("`", "``"))
+        if len(self.primary_key) == 1:
+            query = "SELECT %s FROM %s WHERE %s IN (%s);" % (columns, table, columns, ", ".join(["%s"] * len(keys)))
+            params = [Differ.param(row_key[0]) for row_key in keys]
+        else:
+            row = "(%s)" % ", ".join(["%s"] * len(self.primary_key))
+            query = "SELECT %s FROM %s WHERE (%s) IN (%s);" % (columns, table, columns, ", ".join([row] * len(keys)))
+            params = [Differ.param(value) for row_key in keys for value in row_key]
+        try:
+            rows = self.mysql.fetch_all(query, params)
+        except Error as e:
+            # Failing a lookup only means loading rows the server would have ignored anyway
+            Differ.logger.error("Looking up %d keys of %s failed, keeping their rows: %s" % (len(keys), self.table, e))
+            return set()
+        return { tuple(Differ.text(value) for value in row) for row in rows }
+
+    def write(self, output, batch, future):
+        found = future.result()
+        for line, row_key in batch:
+            if row_key is not None and row_key in found:
+                self.matched = self.matched + 1
+            else:
+                output.write(line)
+                self.missing = self.missing + 1
+
+    @staticmethod
+    def text(value) -> str:
+        # Keys compare as text, the way they appear in the recovered files
+        if isinstance(value, (bytes, bytearray)):
+            return value.decode(LoadData.ENCODING, LoadData.ERRORS)
+        return str(value)
+
+    @staticmethod
+    def param(value):
+        # Keys holding bytes that are not UTF-8 are looked up as the raw bytes the recovered file has
+        try:
+            value.encode(LoadData.ENCODING)
+            return value
+        except UnicodeEncodeError:
+            return value.encode(LoadData.ENCODING, LoadData.ERRORS)
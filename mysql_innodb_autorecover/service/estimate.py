@@ -0,0 +1,171 @@
+import os
+import time
+import random
+import struct
+import logging, verboselogs
+
+from os.path import join, getsize
+from colorama import Fore, Style
+from mysql_innodb_autorecover import APPVSN
+from mysql_innodb_autorecover.mysql.mysql import MySQLUtil
+from mysql_innodb_autorecover.innodb import page, tablespace
+
+verboselogs.install()
+
+class Estimator:
+    """Ranks tables by the deleted records found on a sample of their pages, without compiling, extracting or parsing anything"""
+    logger = logging.getLogger(__module__)
+    SEED   = 0
+
+    def __init__(self, data_dir, metadatas, sample=256, secondary_indexes=False, ibdata=None, page_size=None) -> None:
+        super().__init__()
+        self.data_dir = data_dir
+        self.metadatas = list(metadatas)
+        self.sample = max(1, int(sample))
+        self.secondary_indexes = secondary_indexes
+        self.ibdata_files = [join(data_dir, ibdata_file.strip()) for ibdata_file in ibdata.split(",")] if ibdata else []
+        self.page_size = int(page_size) if page_size else None
+        self.pages_read = 0
+
+    def estimate(self, path=None) -> list:
+        started = time.monotonic()
+        estimates = []
+        shared = {}
+        for metadata in self.metadatas:
+            for table in metadata.tables:
+                row_format = metadata.row_format(table)
+                if row_format is None:
+                    Estimator.logger.error("Table %s not found in database %s, skipping" % (table, metadata.database))
+                    continue
+                # Names are qualified when several databases are ranked, -t takes them the same way
+                name = "%s.%s" % (metadata.database, table) if len(self.metadatas) > 1 else table
+                compact = MySQLUtil.row_format(row_format) != 4
+                indexes = self.indexes(metadata, table)
+                ibd_file = tablespace.ibd_file(self.data_dir, metadata.database, table)
+                if ibd_file is not None:
+                    estimates.append(self.estimate_file(name, ibd_file, compact, indexes))
+                elif self.ibdata_files and indexes:
+                    shared[name] = (compact, indexes)
+                else:
+                    Estimator.logger.warn("No .ibd file found for %s, not estimated" % name)
+        if shared:
+            estimates.extend(self.estimate_system_tablespace(shared))
+        # Most deleted records first, then the most bytes they take
+        estimates.sort(key=lambda estimate: (estimate["deleted_records"], estimate["deleted_bytes"]), reverse=True)
+        self.print_estimates(estimates, time.monotonic() - started)
+        if path:
+            self.save(path, estimates)
+        return estimates
+
+    def indexes(self, metadata, table):
+        # The same indexes a full run parses, all of them when the clustered one is not known
+        if self.secondary_indexes:
+            return set(metadata.index_ids(table)) or None
+        index_id = metadata.clustered_index_id(table)
+        return { index_id } if index_id is not None else None
+
+    def estimate_file(self, table, ibd_file, compact, indexes) -> dict:
+        estimate = Estimator.new_estimate(table)
+        with open(ibd_file, 'rb') as ibd:
+            page_size = self.read_page_size(ibd)
+            pages = getsize(ibd_file) // page_size
+            sampled = self.sample_pages(pages, self.sample)
+            for page_no in sampled:
+                buffer = os.pread(ibd.fileno(), page_size, page_no * page_size)
+                if len(buffer) == page_size and (indexes is None or Estimator.index_id(buffer) in indexes):
+                    self.count_page(estimate, buffer, page_size, compact)
+        estimate["size"] = getsize(ibd_file)
+        return Estimator.extrapolate(estimate, pages, len(sampled))
+
+    def estimate_system_tablespace(self, tables) -> list:
+        # One sample of the shared files, every sampled page counted for the table its index belongs to
+        estimates = { table: Estimator.new_estimate(table) for table in tables }
+        owners = { index_id: table for table, (_, indexes) in tables.items() for index_id in indexes }
+        pages = sampled = 0
+        page_size = None
+        for ibdata_file in self.ibdata_files:
+            if not os.path.exists(ibdata_file) or getsize(ibdata_file) == 0:
+                continue
+            with open(ibdata_file, 'rb') as ibdata:
+                # Only the first file of the system tablespace starts with the FSP header
+                page_size = page_size if page_size else self.read_page_size(ibdata)
+                file_pages = getsize(ibdata_file) // page_size
+                sample = self.sample_pages(file_pages, self.sample * len(tables))
+                for page_no in sample:
+                    buffer = os.pread(ibdata.fileno(), page_size, page_no * page_size)
+                    table = owners.get(Estimator.index_id(buffer)) if len(buffer) == page_size else None
+                    if table is not None:
+                        self.count_page(estimates[table], buffer, page_size, tables[table][0])
+                pages = pages + file_pages
+                sampled = sampled + len(sample)
+        Estimator.logger.info("Sampled %d of %d pages of the system tablespace %s%s%s for %d tables", sampled, pages, Fore.YELLOW, ", ".join(self.ibdata_files),
+                              Style.RESET_ALL, len(tables))
+        return [Estimator.extrapolate(estimate, pages, sampled) for estimate in estimates.values()]
+
+    def read_page_size(self, tablespace_file) -> int:
+        if self.page_size:
+            return self.page_size
+        # Only the FSP flags of page 0 are needed
+        header = os.pread(tablespace_file.fileno(), page.FSP_SPACE_FLAGS + 4, 0)
+        self.pages_read = self.pages_read + 1
+        return page.page_size(header) if len(header) == page.FSP_SPACE_FLAGS + 4 else page.UNIV_PAGE_SIZE
+
+    def sample_pages(self, pages, sample) -> list:
+        # Small tablespaces are read whole. Random rather than evenly spaced pages, as extents interleave the indexes
+        if pages <= sample:
+            chosen = list(range(pages))
+        else:
+            chosen = sorted(random.Random(Estimator.SEED).sample(range(pages), sample))
+        self.pages_read = self.pages_read + len(chosen)
+        return chosen
+
+    def count_page(self, estimate, buffer, page_size, compact):
+        # Only leaf pages hold rows, node pointers on the levels above are not worth recovering
+        if page.page_type(buffer) != page.FIL_PAGE_INDEX or Estimator.level(buffer) != 0:
+            return
+        marked, marked_bytes, purged, purged_bytes = page.deleted_records(buffer, 0, page_size, compact)
+        estimate["index_pages"] = estimate["index_pages"] + 1
+        estimate["pages_with_deleted"] = estimate["pages_with_deleted"] + (1 if marked or purged else 0)
+        estimate["delete_marked"] = estimate["delete_marked"] + marked
+        estimate["purged"] = estimate["purged"] + purged
+        estimate["deleted_bytes"] = estimate["deleted_bytes"] + marked_bytes + purged_bytes
+
+    def print_estimates(self, estimates, elapsed):
+        Estimator.logger.info("-----------------------------------------------")
+        Estimator.logger.info("  %-32s %14s %12s %16s", "Table", "Deleted records", "Deleted MB", "Pages to parse")
+        for estimate in estimates:
+            Estimator.logger.info("  %s%-32s%s %s%14d%s %12.1f %16d", Fore.YELLOW, estimate["table"], Style.RESET_ALL, Fore.CYAN, estimate["deleted_records"], Style.RESET_ALL,
+                                  estimate["deleted_bytes"] / (1 << 20), estimate["pages_with_deleted"])
+        Estimator.logger.info("-----------------------------------------------")
+        Estimator.logger.success("Estimated %d tables from %d sampled pages in %.2fs", len(estimates), self.pages_read, elapsed)
+
+    def save(self, path, estimates):
+        # One table per line, most promising first, usable as -t @path. Tables without deleted records are left out
+        with open(path, 'w') as tables_file:
+            tables_file.write("# Estimated by mysql_innodb_autorecover %s from up to %d sampled pages per table, %s\n" % (APPVSN, self.sample, time.strftime("%Y-%m-%d %H:%M:%S")))
+            for estimate in estimates:
+                if estimate["deleted_records"]:
+                    tables_file.write("%s # ~%d deleted records (%d delete-marked, %d purged), %.1f MB, %d pages to parse\n" % (estimate["table"],
+                                      estimate["deleted_records"], estimate["delete_marked"], estimate["purged"], estimate["deleted_bytes"] / (1 << 20), estimate["pages_with_deleted"]))
+        Estimator.logger.info("Ranked tables written to %s%s%s, recover them with -t @%s", Fore.RED, path, Style.RESET_ALL, path)
+
+    @staticmethod
+    def new_estimate(table) -> dict:
+        return { "table": table, "size": 0, "index_pages": 0, "pages_with_deleted": 0, "delete_marked": 0, "purged": 0, "deleted_bytes": 0 }
+
+    @staticmethod
+    def extrapolate(estimate, pages, sampled) -> dict:
+        # Counts on the sampled pages scaled up to the whole tablespace
+        scale = pages / sampled if sampled else 0.0
+        for measure in ("index_pages", "pages_with_deleted", "delete_marked", "purged", "deleted_bytes"):
+            estimate[measure] = int(round(estimate[measure] * scale))
+        estimate["deleted_records"] = estimate["delete_marked"] + estimate["purged"]
+        return estimate
+
+    @staticmethod
+    def index_id(buffer):
+        return page.index_id(buffer) if page.page_type(buffer) == page.FIL_PAGE_INDEX else None
+
+    @staticmethod
+    def level(buffer) -> int:
+        return struct.unpack_from(">H", buffer, page.PAGE_HEADER + page.PAGE_LEVEL)[0]
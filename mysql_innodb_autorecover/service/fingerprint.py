@@ -0,0 +1,94 @@
+import os
+import json
+import glob
+import hashlib
+import logging, verboselogs
+
+from os.path import join, exists
+from colorama import Fore, Style
+from mysql_innodb_autorecover import APPVSN, PERCONA_URL
+from mysql_innodb_autorecover.innodb import page
+from mysql_innodb_autorecover.percona.load_data import LoadData
+
+verboselogs.install()
+
+class Fingerprint:
+    """Identifies the tablespace, schema and options a table was recovered from, so an unchanged table can reuse its outputs"""
+    logger = logging.getLogger(__module__)
+    FILE   = "fingerprint.json"
+
+    def __init__(self, recovered_dir, options=None) -> None:
+        super().__init__()
+        self.recovered_dir = recovered_dir
+        self.options = dict(options) if options else {}
+
+    def compute(self, files, definition):
+        if not files:
+            return None
+        digest = hashlib.sha256()
+        for item in (PERCONA_URL, APPVSN, json.dumps(self.options, sort_keys=True), json.dumps(definition, sort_keys=True, default=str)):
+            digest.update(item.encode('utf-8'))
+            digest.update(b'\0')
+        for tablespace_file in files:
+            stat = os.stat(tablespace_file)
+            # Only the FIL header of page 0 is read, its checksum and LSNs change whenever the tablespace is written to
+            with open(tablespace_file, 'rb') as tablespace:
+                header = tablespace.read(page.FIL_HEADER.size)
+            fil_header = page.fil_header(header) if len(header) == page.FIL_HEADER.size else None
+            state = [stat.st_size, stat.st_mtime_ns]
+            if fil_header is not None:
+                state += [fil_header.checksum, fil_header.lsn, fil_header.flush_lsn]
+            digest.update(json.dumps(state).encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def path(self, table) -> str:
+        return join(self.recovered_dir, table, Fingerprint.FILE)
+
+    def load(self, table):
+        try:
+            with open(self.path(table)) as fingerprint:
+                return json.load(fingerprint)
+        except (OSError, ValueError):
+            return None
+
+    def matches(self, table, fingerprint):
+        # Previous outputs of the table when it was recovered from the very same state, None otherwise
+        previous = self.load(table)
+        if fingerprint is None or previous is None or previous["fingerprint"] != fingerprint:
+            return None
+        if not all(exists(tsv_file) for tsv_file in previous["files"]):
+            Fingerprint.logger.warn("Outputs of %s%s%s were removed since it was recovered, recovering again", Fore.YELLOW, table, Style.RESET_ALL)
+            return None
+        return previous
+
+    def save(self, table, fingerprint, indexes, queries):
+        if fingerprint is None:
+            return
+        table_dir = join(self.recovered_dir, table)
+        os.makedirs(table_dir, exist_ok=True)
+        # Every file the statements load, plus the other outputs left in the table directory, compressed or not
+        files = { LoadData(query).infile for query in queries }
+        for pattern in ("*.tsv", "*.tsv.gz"):
+            files.update(glob.glob(join(glob.escape(table_dir), pattern)))
+        previous = {
+            "fingerprint": fingerprint,
+            "indexes": indexes,
+            "files": sorted(files),
+            "queries": queries
+        }
+        staging = "%s.%d" % (self.path(table), os.getpid())
+        with open(staging, 'w') as fingerprint_file:
+            json.dump(previous, fingerprint_file, indent=2)
+        os.replace(staging, self.path(table))
+
+    def discard(self, table):
+        # Outputs of an earlier recovery from a different state would be mixed with the new ones
+        previous = self.load(table)
+        if previous is None:
+            return
+        Fingerprint.logger.info("%s%s%s changed since it was last recovered, discarding previous outputs", Fore.YELLOW, table, Style.RESET_ALL)
+        for tsv_file in previous["files"]:
+            if exists(tsv_file):
+                os.remove(tsv_file)
+        os.remove(self.path(table))
@@ -0,0 +1,68 @@
+import os
+import sys
+import logging, verboselogs
+
+from colorama import Fore, Style
+from mysql_innodb_autorecover.service.metrics import Metrics
+from mysql_innodb_autorecover.service.scheduler import Scheduler
+
+verboselogs.install()
+
+class Instance:
+    """Recovers the tables of one or more databases from a single queue, sharing the tools, connection pool, metrics and system tablespace scan"""
+    logger = logging.getLogger(__module__)
+
+    def __init__(self, percona, recovers, jobs=1, loader=None, min_free_space=0) -> None:
+        super().__init__()
+        # One Recover per database, each with its own view of percona when there are several
+        self.percona = percona
+        self.recovers = list(recovers)
+        self.jobs = max(1, int(jobs))
+        self.loader = loader
+        self.scheduler = Scheduler(percona.recovered_indexes_dir, jobs, min_free_space)
+
+    def recover(self):
+        if self.percona.ibdata_files:
+            self.scan_system_tablespace()
+        work = { recover.percona.qualified(table): (recover, table) for recover in self.recovers for table in recover.metadata.tables }
+        if self.jobs > 1:
+            Instance.logger.notice("Recovering %d tables with %s%d%s parallel jobs" % (len(work), Fore.CYAN, self.jobs, Style.RESET_ALL))
+        if len(self.recovers) > 1:
+            Instance.logger.notice("Recovering the tables of %s%d%s databases: %s" % (Fore.CYAN, len(self.recovers), Style.RESET_ALL,
+                                                                                       ", ".join(recover.metadata.database for recover in self.recovers)))
+        self.scheduler.run(lambda name: work[name][0].recover_table(work[name][1]), { name: recover.space_needed(table) for name, (recover, table) in work.items() })
+        for name, error in self.scheduler.failed.items():
+            self.percona.metrics.fail(name, error)
+        for recover in self.recovers:
+            recover.journal.close()
+        self.percona.print_summary()
+        if self.loader is not None:
+            self.loader.load(list(self.percona.metrics.load_sql_queries))
+        self.percona.metrics.report(os.path.join(self.percona.recovered_dir, Metrics.REPORT))
+        self.percona.metrics.close()
+        # Tables that did recover are in the summary and loaded, the run still fails so that nobody takes it for complete
+        failures = []
+        if self.scheduler.failed:
+            failures.append("Recovering %d of %d tables failed: %s" % (len(self.scheduler.failed), len(work), ", ".join(sorted(self.scheduler.failed))))
+        if self.loader is not None and self.loader.failed:
+            failures.append("%s %d tables failed: %s" % ("Validating" if self.loader.dry_run else "Loading", len(self.loader.failed), ", ".join(sorted(self.loader.failed))))
+        if self.loader is not None and self.loader.dry_run and self.loader.invalid:
+            failures.append("Validation found %d invalid rows in the recovered files" % self.loader.invalid)
+        for failure in failures:
+            Instance.logger.critical(failure)
+        if failures:
+            sys.exit(-1)
+
+    def scan_system_tablespace(self):
+        routes = {}
+        scanned = []
+        for recover in self.recovers:
+            tables = recover.system_tablespace_tables()
+            if tables:
+                routes.update(recover.percona.system_tablespace_routes(tables))
+                scanned.append((recover, tables))
+        if routes:
+            # One pass over the system tablespace hands every table of every database its pages
+            self.percona.scan_system_tablespace(routes, sum(len(tables) for _, tables in scanned))
+            for recover, tables in scanned:
+                recover.percona.system_tablespace_tables.update(tables)
@@ -0,0 +1,60 @@
+import os
+import json
+import threading
+import logging, verboselogs
+
+from os.path import join, exists
+from colorama import Fore, Style
+
+verboselogs.install()
+
+class Journal:
+    """Append-only record of the stages each table completed, so an interrupted run can resume where it stopped"""
+    logger  = logging.getLogger(__module__)
+    FILE    = "journal.jsonl"
+    DEFS    = "defs"
+    COMPILE = "compile"
+    PAGES   = "pages"
+    PARSE   = "parse"
+    OUTPUTS = "outputs"
+
+    def __init__(self, recovered_dir, resume=False) -> None:
+        super().__init__()
+        self.path = join(recovered_dir, Journal.FILE)
+        self.lock = threading.Lock()
+        self.entries = {}
+        os.makedirs(recovered_dir, exist_ok=True)
+        if resume and exists(self.path):
+            self.load()
+            Journal.logger.notice("Resuming from %s%s%s: %d tables already recovered", Fore.YELLOW, self.path, Style.RESET_ALL,
+                                  sum(1 for stages in self.entries.values() if Journal.OUTPUTS in stages))
+            self.handle = open(self.path, 'a')
+        else:
+            self.handle = open(self.path, 'w')
+
+    def load(self):
+        with open(self.path) as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Last line may be cut short by the crash that interrupted the run
+                    Journal.logger.warn("Ignoring incomplete journal entry: %s" % line.strip())
+                    continue
+                self.entries.setdefault(entry.pop("table"), {})[entry.pop("stage")] = entry
+
+    def record(self, table, stage, **state):
+        with self.lock:
+            self.handle.write(json.dumps(dict(table=table, stage=stage, **state)) + "\n")
+            self.handle.flush()
+            os.fsync(self.handle.fileno())
+            self.entries.setdefault(table, {})[stage] = state
+
+    def done(self, table, stage) -> bool:
+        return stage in self.entries.get(table, {})
+
+    def state(self, table, stage):
+        return self.entries.get(table, {}).get(stage)
+
+    def close(self):
+        self.handle.close()
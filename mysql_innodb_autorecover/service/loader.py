@@ -0,0 +1,166 @@
+import os
+import time
+import logging, verboselogs
+
+from os.path import join, dirname, basename
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from colorama import Fore, Style
+from mysql.connector import Error
+from mysql_innodb_autorecover.percona.load_data import LoadData
+from mysql_innodb_autorecover.percona.compress import Compressor
+
+verboselogs.install()
+
+class Loader:
+    """Loads the recovered files into their tables over pooled connections, or only validates them on a dry run"""
+    logger        = logging.getLogger(__module__)
+    CHUNK         = ".%s.chunk"
+    SHOWN_ERRORS  = 5
+
+    def __init__(self, mysql=None, metadatas=None, jobs=1, chunk_rows=100000, dry_run=False, metrics=None) -> None:
+        super().__init__()
+        self.mysql = mysql
+        # Metadata of every database loaded into, for validating the files
+        self.metadatas = { metadata.database: metadata for metadata in metadatas } if metadatas else {}
+        self.jobs = max(1, int(jobs))
+        self.chunk_rows = max(1, int(chunk_rows))
+        self.dry_run = dry_run
+        self.metrics = metrics
+        self.rows = 0
+        self.warnings = 0
+        self.invalid = 0
+        self.failed = []
+
+    def run(self, work, table, files):
+        if self.metrics is None:
+            return work(table, files)
+        with self.metrics.stage(table, "validate" if self.dry_run else "load") as stage:
+            rows, problems = work(table, files)
+            stage["records"] = rows
+            stage["bytes_read"] = sum(os.path.getsize(load_data.infile) for load_data in files)
+            return rows, problems
+
+    def load(self, queries):
+        tables = {}
+        for query in queries:
+            load_data = LoadData(query)
+            tables.setdefault(load_data.name, []).append(load_data)
+        if not tables:
+            Loader.logger.notice("Nothing to load")
+            return
+        started = time.monotonic()
+        Loader.logger.notice("%s %d tables with %s%d%s parallel jobs", "Validating" if self.dry_run else "Loading", len(tables), Fore.CYAN, self.jobs, Style.RESET_ALL)
+        work = self.validate_table if self.dry_run else self.load_table
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = { executor.submit(self.run, work, table, files): table for table, files in tables.items() }
+            for future in as_completed(futures):
+                try:
+                    rows, problems = future.result()
+                except Exception as e:
+                    Loader.logger.error("Loading table %s failed: %s" % (futures[future], e))
+                    self.failed.append(futures[future])
+                    continue
+                self.rows = self.rows + rows
+                # Warnings from the server when loading, invalid rows when validating
+                if self.dry_run:
+                    self.invalid = self.invalid + problems
+                else:
+                    self.warnings = self.warnings + problems
+        elapsed = time.monotonic() - started
+        if self.dry_run:
+            Loader.logger.success("Validated %s%d%s rows, %s%d%s invalid", Fore.CYAN, self.rows, Style.RESET_ALL, Fore.CYAN, self.invalid, Style.RESET_ALL)
+        else:
+            Loader.logger.success("Loaded %s%d%s rows into %d tables in %.2fs (%.0f rows/s, %d warnings)", Fore.CYAN, self.rows, Style.RESET_ALL,
+                                  len(tables) - len(self.failed), elapsed, self.rows / elapsed if elapsed else 0.0, self.warnings)
+        if self.failed:
+            Loader.logger.error("Tables not loaded: %s" % ", ".join(sorted(self.failed)))
+
+    def load_table(self, table, files):
+        started = time.monotonic()
+        rows = warnings = 0
+        conn = self.mysql.connection
+        try:
+            cursor = conn.cursor()
+            try:
+                # Same session settings the printed SQL file starts with
+                cursor.execute("SET FOREIGN_KEY_CHECKS=0")
+                for load_data in files:
+                    for chunk in self.chunks(load_data):
+                        try:
+                            cursor.execute(load_data.load_statement(chunk))
+                            # Every chunk is its own transaction, so undo stays bounded on large files
+                            conn.commit()
+                            rows = rows + max(cursor.rowcount, 0)
+                            warnings = warnings + self.report_warnings(cursor, table)
+                        except Error:
+                            conn.rollback()
+                            raise
+                        finally:
+                            if chunk != load_data.infile:
+                                os.remove(chunk)
+            finally:
+                cursor.close()
+        finally:
+            conn.close()
+        elapsed = time.monotonic() - started
+        Loader.logger.success("Loaded %s%d%s rows into %s%s%s in %.2fs (%.0f rows/s, %d warnings)", Fore.CYAN, rows, Style.RESET_ALL, Fore.YELLOW, table, Style.RESET_ALL,
+                              elapsed, rows / elapsed if elapsed else 0.0, warnings)
+        return rows, warnings
+
+    def chunks(self, load_data):
+        # Files up to chunk_rows rows are loaded as they are, larger ones a chunk file at a time.
+        # The server cannot read compressed files, those are always decompressed a chunk at a time
+        chunk_file = join(dirname(load_data.infile), Loader.CHUNK % basename(load_data.infile))
+        with Compressor.reader(load_data.infile) as data:
+            rows = (line for line, _ in load_data.rows(data))
+            lines = list(islice(rows, self.chunk_rows))
+            following = list(islice(rows, 1))
+            if not following and not Compressor.compressed(load_data.infile):
+                yield load_data.infile
+                return
+            while lines:
+                yield Loader.write_chunk(chunk_file, lines)
+                lines = following + list(islice(rows, self.chunk_rows - len(following)))
+                following = []
+
+    def report_warnings(self, cursor, table) -> int:
+        count = cursor.warning_count or 0
+        if count:
+            cursor.execute("SHOW WARNINGS LIMIT %d" % Loader.SHOWN_ERRORS)
+            for level, code, message in cursor.fetchall():
+                Loader.logger.warn("[%s] %s %s: %s" % (table, level, code, message))
+        return count
+
+    def validate_table(self, table, files):
+        # Statements without a database are those of a single database run
+        metadata = self.metadatas.get(files[0].database) if files[0].database else next(iter(self.metadatas.values()), None)
+        schema = { column["COLUMN_NAME"]: column for column in metadata.columns.get(files[0].table, []) } if metadata else {}
+        if not schema:
+            raise Exception("table %s not found in the schema" % table)
+        rows = invalid = 0
+        for load_data in files:
+            unknown = [column for column in load_data.columns if column not in schema]
+            if unknown:
+                raise Exception("%s loads columns missing from %s: %s" % (load_data.infile, table, ", ".join(unknown)))
+            not_null = [position for position, column in enumerate(load_data.columns) if schema[column]["IS_NULLABLE"] != "YES"]
+            with Compressor.reader(load_data.infile) as data:
+                for number, (line, fields) in enumerate(load_data.rows(data), 1):
+                    rows = rows + 1
+                    if len(fields) != len(load_data.columns):
+                        problem = "%d fields, expected %d" % (len(fields), len(load_data.columns))
+                    elif any(fields[position] == LoadData.NULL for position in not_null):
+                        problem = "NULL in a NOT NULL column"
+                    else:
+                        continue
+                    invalid = invalid + 1
+                    if invalid <= Loader.SHOWN_ERRORS:
+                        Loader.logger.warn("[%s] row %d of %s: %s" % (table, number, load_data.infile, problem))
+        Loader.logger.success("Validated %s%d%s rows of %s%s%s: %d invalid", Fore.CYAN, rows, Style.RESET_ALL, Fore.YELLOW, table, Style.RESET_ALL, invalid)
+        return rows, invalid
+
+    @staticmethod
+    def write_chunk(chunk_file, lines) -> str:
+        with open(chunk_file, 'w', encoding=LoadData.ENCODING, errors=LoadData.ERRORS) as chunk:
+            chunk.writelines(lines)
+        return chunk_file
@@ -0,0 +1,124 @@
+import os
+import zlib
+import shutil
+import logging, verboselogs
+
+from os.path import join, basename
+from colorama import Fore, Style
+from mysql_innodb_autorecover.percona.load_data import LoadData
+from mysql_innodb_autorecover.percona.compress import Compressor
+
+verboselogs.install()
+
+class Merger:
+    """Merges the TSV files recovered from every index of a table into one file holding a single row per primary key"""
+    logger          = logging.getLogger(__module__)
+    MERGED          = "%s.merged.tsv"
+    CONFLICTS       = "%s.conflicts.tsv"
+    PARTITIONS_DIR  = ".partitions"
+    # Rows are spread over partitions on disk by key hash, each partition is then deduplicated in memory
+    PARTITION_BYTES = 64 << 20
+    MAX_PARTITIONS  = 256
+
+    def __init__(self, table_dir, table, queries, primary_key=None, clustered_index=None, compressor=None) -> None:
+        super().__init__()
+        self.table_dir = table_dir
+        self.table = table
+        self.sources = [LoadData(query) for query in queries]
+        self.primary_key = list(primary_key) if primary_key else []
+        self.clustered_index = clustered_index
+        self.compressor = compressor
+        self.merged_file = join(table_dir, Merger.MERGED % table)
+        self.conflicts_file = join(table_dir, Merger.CONFLICTS % table)
+        if compressor is not None:
+            self.merged_file = compressor.name(self.merged_file)
+            self.conflicts_file = compressor.name(self.conflicts_file)
+        self.rows = 0
+        self.merged = 0
+        self.duplicates = 0
+        self.conflicts = 0
+
+    def merge(self) -> str:
+        load_data = self.sources[0]
+        key = self.key_positions(load_data.columns)
+        if key is None:
+            Merger.logger.warn("Primary key of %s%s%s not found in the recovered columns, only identical rows are merged", Fore.YELLOW, self.table, Style.RESET_ALL)
+        partitions_dir = join(self.table_dir, Merger.PARTITIONS_DIR)
+        os.makedirs(partitions_dir, exist_ok=True)
+        try:
+            partitions = self.partition(partitions_dir, key)
+            with self.output(self.merged_file) as merged, self.output(self.conflicts_file) as conflicts:
+                for partition in partitions:
+                    self.merge_partition(partition, key, merged, conflicts)
+        finally:
+            shutil.rmtree(partitions_dir, ignore_errors=True)
+        if self.conflicts == 0:
+            os.remove(self.conflicts_file)
+        Merger.logger.success("Merged %s%d%s rows of %s into %s%d%s (%d duplicates, %d conflicting rows)", Fore.CYAN, self.rows, Style.RESET_ALL, self.table,
+                              Fore.CYAN, self.merged, Style.RESET_ALL, self.duplicates, self.conflicts)
+        return load_data.with_infile(self.merged_file)
+
+    def output(self, path):
+        return self.compressor.open(path) if self.compressor is not None else open(path, 'w', encoding=LoadData.ENCODING, errors=LoadData.ERRORS)
+
+    def key_positions(self, columns):
+        if not self.primary_key or any(column not in columns for column in self.primary_key):
+            return None
+        return [columns.index(column) for column in self.primary_key]
+
+    def partition(self, partitions_dir, key) -> list:
+        size = sum(Compressor.data_size(source.infile) for source in self.sources)
+        count = min(Merger.MAX_PARTITIONS, size // Merger.PARTITION_BYTES + 1)
+        paths = [join(partitions_dir, "%d" % number) for number in range(count)]
+        outputs = [open(path, 'w', encoding=LoadData.ENCODING, errors=LoadData.ERRORS) for path in paths]
+        try:
+            for number, source in enumerate(self.sources):
+                with Compressor.reader(source.infile) as data:
+                    for line, fields in source.rows(data):
+                        self.rows = self.rows + 1
+                        # Each partition line carries the index it came from, which decides between versions of a row
+                        outputs[zlib.crc32(self.row_key(fields, key).encode(LoadData.ENCODING, LoadData.ERRORS)) % count].write("%d\t%s" % (number, line if line.endswith("\n") else line + "\n"))
+        finally:
+            for output in outputs:
+                output.close()
+        return paths
+
+    def merge_partition(self, partition, key, merged, conflicts):
+        best = {}
+        versions = {}
+        with open(partition, encoding=LoadData.ENCODING, errors=LoadData.ERRORS) as rows:
+            for row in rows:
+                number, line = row.split("\t", 1)
+                source = self.sources[int(number)]
+                fields = line[len(source.lines_starting):].rstrip("\n").split(source.fields_terminated)
+                row_key = self.row_key(fields, key)
+                rank = self.rank(source, fields)
+                versions.setdefault(row_key, []).append(line)
+                # First seen wins between rows of equal rank, so files are read in index order
+                if row_key not in best or rank > best[row_key][0]:
+                    best[row_key] = (rank, line)
+        for row_key, (_, line) in best.items():
+            merged.write(line)
+            self.merged = self.merged + 1
+            # Other distinct versions of the row are kept aside for the operator, exact copies are dropped
+            others = [version for version in dict.fromkeys(versions[row_key]) if version != line]
+            conflicts.writelines(others)
+            self.conflicts = self.conflicts + len(others)
+            self.duplicates = self.duplicates + len(versions[row_key]) - 1 - len(others)
+
+    def rank(self, source, fields) -> tuple:
+        # Rows from the clustered index first, then rows carrying every column, then rows with the fewest NULLs
+        clustered = self.clustered_index is not None and self.index_of(source) == self.clustered_index
+        complete = len(fields) == len(source.columns)
+        return clustered, complete, sum(1 for field in fields if field != LoadData.NULL)
+
+    def index_of(self, source) -> str:
+        # Recovered files are named <table><index>.tsv, with .gz appended when compressed
+        name = basename(Compressor.stem(source.infile))
+        return name[len(self.table):-len(".tsv")] if name.startswith(self.table) else name
+
+    @staticmethod
+    def row_key(fields, key) -> str:
+        if key is None or len(fields) <= max(key):
+            return "\t".join(fields)
+        return "\t".join(fields[position] for position in key)
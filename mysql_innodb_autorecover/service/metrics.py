@@ -0,0 +1,101 @@
+import json
+import time
+import resource
+import threading
+import logging, verboselogs
+
+from contextlib import contextmanager
+from colorama import Fore, Style
+
+verboselogs.install()
+
+class Metrics:
+    """Counters and per table stage timings of one recovery run, kept apart from any other run in the same process"""
+    logger   = logging.getLogger(__module__)
+    REPORT   = "run_report.json"
+    COUNTERS = ["tables", "indexes", "recovered_indexes", "cache_hits", "cache_misses", "skipped_pages", "merged_tables", "conflicting_rows", "present_rows", "missing_rows"]
+    MEASURES = ["wall", "cpu", "child_cpu", "bytes_read", "bytes_written", "pages", "records"]
+
+    def __init__(self, stream=None) -> None:
+        super().__init__()
+        self.lock = threading.Lock()
+        self.started = time.time()
+        for counter in Metrics.COUNTERS:
+            setattr(self, counter, 0)
+        self.recovered_tables = set()
+        self.failed_tables = {}
+        self.load_sql_queries = []
+        self.stages = []
+        self.stream = open(stream, 'a') if stream else None
+
+    def add(self, **counters):
+        with self.lock:
+            for counter, value in counters.items():
+                setattr(self, counter, getattr(self, counter) + value)
+
+    def fail(self, table, error):
+        with self.lock:
+            self.failed_tables[table] = error
+
+    @contextmanager
+    def stage(self, table, name):
+        # The stage fills in bytes, pages and records itself, time is measured here
+        stage = { "table": table, "stage": name, "bytes_read": 0, "bytes_written": 0, "pages": 0, "records": 0 }
+        started, cpu, child_cpu = time.monotonic(), time.thread_time(), Metrics.children_cpu()
+        try:
+            yield stage
+        except BaseException:
+            stage["failed"] = True
+            raise
+        finally:
+            stage["wall"] = time.monotonic() - started
+            stage["cpu"] = time.thread_time() - cpu
+            # Children are only accounted once waited for, and process wide: with parallel jobs this includes their children too
+            stage["child_cpu"] = Metrics.children_cpu() - child_cpu
+            self.record(stage)
+
+    def record(self, stage):
+        with self.lock:
+            self.stages.append(stage)
+            if self.stream is not None:
+                self.stream.write(json.dumps(dict(stage, time=time.time())) + "\n")
+                self.stream.flush()
+
+    def totals(self) -> dict:
+        stages = {}
+        with self.lock:
+            for stage in self.stages:
+                totals = stages.setdefault(stage["stage"], dict({ measure: 0 for measure in Metrics.MEASURES }, count=0, failed=0))
+                totals["count"] = totals["count"] + 1
+                totals["failed"] = totals["failed"] + (1 if stage.get("failed") else 0)
+                for measure in Metrics.MEASURES:
+                    totals[measure] = totals[measure] + stage[measure]
+        return stages
+
+    def report(self, path):
+        stages = self.totals()
+        with self.lock:
+            tables = {}
+            for stage in self.stages:
+                if stage["table"] is not None:
+                    tables.setdefault(stage["table"], []).append({ key: value for key, value in stage.items() if key != "table" })
+            report = {
+                "started": self.started,
+                "elapsed": time.time() - self.started,
+                "counters": dict({ counter: getattr(self, counter) for counter in Metrics.COUNTERS }, recovered_tables=sorted(self.recovered_tables),
+                                 failed_tables=dict(sorted(self.failed_tables.items()))),
+                "stages": stages,
+                "tables": tables
+            }
+        with open(path, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+        Metrics.logger.info("Run report written to %s%s%s", Fore.RED, path, Style.RESET_ALL)
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+
+    @staticmethod
+    def children_cpu() -> float:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime + usage.ru_stime
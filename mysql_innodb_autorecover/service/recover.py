@@ -1,34 +1,197 @@
 import os
+import shutil
 import logging, verboselogs
 
 from colorama import Fore, Style, Back
 from getpass import getpass
 from mysql.connector import cursor, pooling, Error
+from mysql_innodb_autorecover.mysql.mysql import MySQLUtil
+from mysql_innodb_autorecover.service.journal import Journal
+from mysql_innodb_autorecover.service.fingerprint import Fingerprint
+from mysql_innodb_autorecover.service.merge import Merger
+from mysql_innodb_autorecover.service.diff import Differ
+from mysql_innodb_autorecover.service.instance import Instance
+from mysql_innodb_autorecover.innodb import page
 
 verboselogs.install()
 
 class Recover:
     logger = logging.getLogger(__module__)
 
-    def __init__(self, mysql=None, percona=None) -> None:
+    def __init__(self, mysql=None, percona=None, jobs=1, secondary_indexes=False, metadata=None, journal=None, incremental=False, merge=False, diff=False, diff_batch=1000, diff_jobs=1, loader=None, min_free_space=0) -> None:
         super().__init__()
         self.mysql = mysql
         self.percona = percona
+        # Either fetched from the server or loaded from a schema snapshot when recovering offline
+        self.metadata = metadata if metadata else mysql.metadata
+        self.jobs = max(1, int(jobs))
+        self.secondary_indexes = secondary_indexes
+        self.journal = journal if journal else Journal(percona.recovered_dir)
+        self.incremental = incremental
+        self.merge = merge
+        self.diff = diff
+        self.diff_batch = diff_batch
+        self.diff_jobs = diff_jobs
+        self.loader = loader
+        self.min_free_space = min_free_space
+        self.fingerprint = Fingerprint(percona.recovered_dir, {
+            "secondary_indexes": secondary_indexes,
+            "page_scanner": percona.page_scanner,
+            "page_filter": percona.page_filter,
+            "defs_generator": percona.defs_generator,
+            "merge": merge,
+            "diff": diff,
+            "compress": percona.compressor is not None
+        })
+        self.fingerprints = {}
 
     def recover(self):
-        for table in self.mysql.tables:
-            Recover.logger.notice("Attempting to recover table %s%s%s%s" % (Style.BRIGHT, Fore.CYAN, table, Style.RESET_ALL))
+        Instance(self.percona, [self], self.jobs, self.loader, self.min_free_space).recover()
+
+    def recover_table(self, table):
+        with self.percona.metrics.stage(self.percona.qualified(table), "table"):
+            self.recover_stages(table)
+
+    def recover_stages(self, table):
+        if self.journal.done(table, Journal.OUTPUTS):
+            Recover.logger.notice("Table %s%s%s%s already recovered, skipping" % (Style.BRIGHT, Fore.CYAN, self.percona.qualified(table), Style.RESET_ALL))
+            self.percona.count_scanned(self.journal.state(table, Journal.PARSE)["indexes"])
+            self.percona.count_recovered(table, self.journal.state(table, Journal.OUTPUTS)["queries"])
+            return
+        Recover.logger.notice("Attempting to recover table %s%s%s%s" % (Style.BRIGHT, Fore.CYAN, self.percona.qualified(table), Style.RESET_ALL))
+        row_format = self.get_row_format(table)
+        if row_format is None:
+            Recover.logger.error("Table %s not found in database %s, skipping" % (table, self.metadata.database))
+            return
+        fingerprint = self.table_fingerprint(table)
+        if self.incremental:
+            previous = self.fingerprint.matches(table, fingerprint)
+            if previous is not None:
+                Recover.logger.notice("Table %s%s%s%s unchanged since it was last recovered, reusing its outputs" % (Style.BRIGHT, Fore.CYAN, self.percona.qualified(table), Style.RESET_ALL))
+                self.percona.count_scanned(previous["indexes"])
+                self.percona.count_recovered(table, previous["queries"])
+                return
+            self.fingerprint.discard(table)
+        constraints_parser, parser_table = self.compile(table)
+        parsed = self.resumed_parse(table)
+        if parsed is None:
+            if not self.resumed_pages(table):
+                if table not in self.percona.system_tablespace_tables:
+                    # Pages left behind by an interrupted extraction would otherwise be parsed twice
+                    shutil.rmtree(self.percona.table_dir(table), ignore_errors=True)
+                indexes = None if self.secondary_indexes else self.get_clustered_index(table)
+                if not self.percona.extract_innodb_pages(self.metadata.database, table, row_format, indexes):
+                    return
+                self.journal.record(table, Journal.PAGES)
+            parsed = self.percona.parse_indexes(table, row_format, constraints_parser)
+            self.journal.record(table, Journal.PARSE, indexes=len(parsed), results=parsed)
+        queries = self.percona.save_outputs(table, parsed, parser_table)
+        if self.merge and queries:
+            queries = self.merge_outputs(table, queries)
+        if self.diff and queries:
+            queries = self.diff_outputs(table, queries)
+        self.journal.record(table, Journal.OUTPUTS, queries=queries)
+        self.fingerprint.save(table, fingerprint, len(parsed), queries)
+
+    def merge_outputs(self, table, queries) -> list:
+        clustered = self.metadata.clustered_index_id(table)
+        merger = Merger(os.path.join(self.percona.recovered_dir, table), table, queries, self.metadata.primary_keys.get(table),
+                        page.index_name(clustered) if clustered is not None else None, self.percona.compressor)
+        with self.percona.metrics.stage(self.percona.qualified(table), "merge") as stage:
+            merged_query = merger.merge()
+            stage["records"] = merger.rows
+            stage["bytes_read"] = sum(os.path.getsize(source.infile) for source in merger.sources)
+            stage["bytes_written"] = os.path.getsize(merger.merged_file)
+        self.percona.count_merged(queries, merged_query, merger.conflicts)
+        return [merged_query]
+
+    def diff_outputs(self, table, queries) -> list:
+        differ = Differ(self.mysql, self.metadata.database, table, self.metadata.primary_keys.get(table), self.diff_batch, self.diff_jobs, self.percona.compressor)
+        with self.percona.metrics.stage(self.percona.qualified(table), "diff") as stage:
+            missing_queries = differ.diff(queries)
+            stage["records"] = differ.matched + differ.missing
+        self.percona.count_missing(queries, missing_queries, differ.matched, differ.missing)
+        return missing_queries
+
+    def space_needed(self, table) -> int:
+        # Extracted pages and the files parsed from them, each at most the size of the tablespace
+        if self.journal.done(table, Journal.OUTPUTS) or not self.percona.has_ibd_file(self.metadata.database, table):
+            return 0
+        if self.incremental and self.fingerprint.matches(table, self.table_fingerprint(table)) is not None:
+            return 0
+        return 2 * sum(os.path.getsize(ibd_file) for ibd_file in self.percona.tablespace_files(self.metadata.database, table))
+
+    def table_fingerprint(self, table):
+        # Taken before the table is recovered, so that writes to the tablespace during recovery are picked up next time
+        if table not in self.fingerprints:
+            files = self.percona.tablespace_files(self.metadata.database, table)
+            self.fingerprints[table] = self.fingerprint.compute(files, self.metadata.definition(table))
+        return self.fingerprints[table]
+
+    def compile(self, table):
+        compiled = self.journal.state(table, Journal.COMPILE)
+        if compiled is not None and os.path.exists(compiled["binary"]):
+            Recover.logger.info("Resuming %s with constraints_parser %s" % (table, compiled["binary"]))
+            return compiled["binary"], compiled["parser_table"]
+        workspace = self.percona.create_workspace(table)
+        try:
+            with self.percona.metrics.stage(self.percona.qualified(table), "defs"):
+                if self.mysql is not None and self.percona.defs_generator == self.percona.CREATE_DEFS_BIN:
+                    self.percona.create_table_defs(table, workspace, self.mysql.host, self.mysql.port, self.mysql.user, self.mysql.password, self.metadata.database)
+                else:
+                    self.percona.generate_table_defs(table, workspace, self.metadata)
+            self.journal.record(table, Journal.DEFS)
+            constraints_parser, parser_table = self.percona.compile_table_defs(table, workspace, progress=self.jobs == 1)
+        finally:
+            self.percona.remove_workspace(workspace)
+        self.journal.record(table, Journal.COMPILE, binary=constraints_parser, parser_table=parser_table)
+        return constraints_parser, parser_table
+
+    def resumed_pages(self, table) -> bool:
+        # Pages are deleted as their index gets parsed, once parsing started they have to be extracted again
+        return self.journal.done(table, Journal.PAGES) and os.path.exists(self.percona.table_dir(table)) and not self.percona.parse_started(table)
+
+    def resumed_parse(self, table):
+        parsed = self.journal.state(table, Journal.PARSE)
+        # Parsed TSV files are only usable while all of them are still waiting in the table's work directory
+        if parsed is None or not all(tsv_file is None or os.path.exists(tsv_file) for _, tsv_file, _ in parsed["results"]):
+            return None
+        Recover.logger.info("Resuming %s from %d parsed indexes" % (table, parsed["indexes"]))
+        self.percona.count_scanned(parsed["indexes"])
+        return parsed["results"]
+
+
+    def system_tablespace_tables(self) -> dict:
+        # Tables without an .ibd file, with what it takes to route their pages out of the system tablespace
+        tables = {}
+        for table in self.metadata.tables:
             row_format = self.get_row_format(table)
-            self.percona.generate_table_defs(table, self.mysql.host, self.mysql.port, self.mysql.user, self.mysql.password, self.mysql.database)
-            self.percona.compile(alternate=True)
-            if self.percona.extract_innodb_pages(self.mysql.database, table, row_format):
-                self.percona.extract_data(table, row_format)
-        self.percona.print_summary()
-            
+            if row_format is None or self.percona.has_ibd_file(self.metadata.database, table):
+                continue
+            if self.journal.done(table, Journal.OUTPUTS) or self.resumed_pages(table):
+                continue
+            if self.incremental and self.fingerprint.matches(table, self.table_fingerprint(table)) is not None:
+                continue
+            indexes = self.metadata.index_ids(table) if self.secondary_indexes else self.get_clustered_index(table)
+            if not indexes:
+                Recover.logger.warn("No InnoDB index ids known for %s, its pages cannot be found in the system tablespace" % table)
+                continue
+            tables[table] = (row_format, indexes)
+        return tables
+
+    def get_clustered_index(self, table):
+        index_id = self.metadata.clustered_index_id(table)
+        if index_id is None:
+            Recover.logger.warn("Clustered index of %s not found in InnoDB metadata, parsing all of its indexes" % table)
+            return None
+        Recover.logger.debug("Clustered index: %d" % index_id)
+        return { index_id }
+
     def get_row_format(self, table) -> int:
-        query = "SELECT ROW_FORMAT from information_schema.TABLES WHERE TABLE_SCHEMA='%s' AND TABLE_NAME='%s';" % (self.mysql.database, table)
-        Recover.logger.debug(query)
-        row_format = self.mysql.row_format(self.mysql.fetch(query)[0])
+        row_format = self.metadata.row_format(table)
+        if row_format is None:
+            return None
+        row_format = MySQLUtil.row_format(row_format)
         Recover.logger.debug("Format: %s" % row_format)
         return row_format
 
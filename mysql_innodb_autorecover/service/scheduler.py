@@ -0,0 +1,57 @@
+import shutil
+import logging, verboselogs
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from colorama import Fore, Style
+
+verboselogs.install()
+
+class Scheduler:
+    """Runs tables in parallel, largest first, starting a table only once the disk space its intermediate files need is free"""
+    logger = logging.getLogger(__module__)
+
+    def __init__(self, path, jobs=1, reserve=0) -> None:
+        super().__init__()
+        # Intermediate files of every table go under path
+        self.path = path
+        self.jobs = max(1, int(jobs))
+        self.reserve = max(0, int(reserve))
+        self.throttled = 0
+        self.failed = {}
+
+    def run(self, work, needs):
+        # needs maps every table to the bytes its intermediate files may take. The biggest tables go first, while
+        # there is the most room and so that none of them is left to run alone at the end
+        pending = sorted(needs, key=lambda table: needs[table], reverse=True)
+        running = {}
+        waiting = None
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while pending or running:
+                while pending and len(running) < self.jobs:
+                    table = pending[0]
+                    available = self.available(sum(needs[running_table] for running_table in running.values()))
+                    if needs[table] > available:
+                        if running:
+                            # Tables start in order, the next one waits until running ones release their space
+                            if waiting != table:
+                                Scheduler.logger.notice("Waiting for %s%.0f MB%s of free space to recover %s%s%s, %d tables running", Fore.CYAN, needs[table] / (1 << 20),
+                                                        Style.RESET_ALL, Fore.YELLOW, table, Style.RESET_ALL, len(running))
+                                waiting = table
+                                self.throttled = self.throttled + 1
+                            break
+                        Scheduler.logger.warn("%s may need %.0f MB for intermediate files, only %.0f MB free under %s", table, needs[table] / (1 << 20),
+                                              max(available, 0) / (1 << 20), self.path)
+                    pending.pop(0)
+                    running[executor.submit(work, table)] = table
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    table = running.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        Scheduler.logger.error("Recovering table %s failed: %s" % (table, e))
+                        self.failed[table] = str(e) or type(e).__name__
+
+    def available(self, in_flight) -> int:
+        # Running tables may not have written all of their files yet, their whole estimate stays set aside
+        return shutil.disk_usage(self.path).free - self.reserve - in_flight